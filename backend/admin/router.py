@@ -0,0 +1,50 @@
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+
+from backend.auth.auth import get_admin_user
+from backend.core.diagnostics import sample_profile
+
+router = APIRouter(
+    prefix = "/admin",
+    tags = ["admin"],
+    dependencies = [Depends(get_admin_user)],
+)
+
+@router.get("/diagnostics")
+def diagnostics(request: Request, slow: int = Query(20, ge=1, le=50)):
+    """
+    event loop lag、被卡住時抓到的 stack、最慢的 requests（含各 span 耗時）
+    """
+    state = request.app.state
+    monitor = state.services.loop_monitor
+    return {
+        "loop": monitor.snapshot(),
+        "blocked": monitor.blocked_samples(),
+        "slow_requests": [t.to_dict() for t in state.traces.slow[:slow]],
+        "recent_requests": [t.to_dict() for t in list(state.traces.recent)[-20:]],
+    }
+
+@router.get("/diagnostics/profile")
+async def profile(
+    request: Request,
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval_ms: float = Query(5.0, ge=1, le=100),
+    format: str = Query("json", pattern="^(json|collapsed)$"),
+):
+    """
+    On-demand sampling profile of the event-loop thread.
+    format=collapsed 可直接丟給 flamegraph.pl / speedscope
+    """
+    thread_id = request.app.state.services.loop_monitor.loop_thread_id
+    try:
+        result = await asyncio.to_thread(
+            sample_profile, thread_id, seconds, interval_ms / 1000.0
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if format == "collapsed":
+        return PlainTextResponse(result["collapsed"])
+    return result
@@ -1,116 +1,248 @@
 import asyncio
+import os
 import uuid
 import json
 from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Optional
 
-from fastapi import FastAPI, HTTPException, WebSocket, Query
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, WebSocket, Query
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from starlette.requests import HTTPConnection
 from starlette.websockets import WebSocketDisconnect
-from jose import jwt
+from jose import JWTError, jwt
 
 from backend.core.task_queue import TaskQueue, ChatJob
 from backend.core.worker import Worker
+from backend.core.rate_limiter import RateLimiter
+from backend.core.diagnostics import LoopLagMonitor, RequestTraceMiddleware, TraceStore, span
 from backend.services.emotion import EmotionAnalyzer
-from backend.db.base import Base, engine
-from backend.db import models
+from backend.services.policy import triage_priority
+from backend.services.llm import create_llm_client
+from backend.db.base import init_db
 from backend.auth.router import router as auth_router
-from backend.auth.auth import get_current_user, SECRET_KEY, ALGORITHM
+from backend.history.router import router as history_router
+from backend.admin.router import router as admin_router
+from backend.auth.auth import get_admin_user, get_current_user, SECRET_KEY, ALGORITHM
 
 
-# ============ DB ============
-Base.metadata.create_all(bind=engine)
+# ============ services container ============
+@dataclass
+class AppServices:
+    triage_emotion: EmotionAnalyzer
+    queue: TaskQueue
+    rate_limiter: RateLimiter
+    worker: Worker
+    loop_monitor: LoopLagMonitor
 
 
-# ============ global services ============
-triage_emotion = EmotionAnalyzer()
-queue = TaskQueue(maxsize=200)
-worker = Worker(queue=queue, result_ttl_sec=300)
+def build_services(llm_backend: str) -> AppServices:
+    """
+    建立所有 runtime services（只在 lifespan 裡呼叫，import 時不做任何事）
+    """
+    queue = TaskQueue(maxsize=200)
+    rate_limiter = RateLimiter(
+        requests_per_sec = 1.0,
+        request_burst = 5,
+        llm_tokens_per_min = 4000,
+        urgent_priority = 1,
+        urgent_requests_per_sec = 3.0,
+        urgent_burst = 20,
+    )
+    llm = create_llm_client(llm_backend)
+    worker = Worker(
+        queue = queue,
+        result_ttl_sec = 300,
+        rate_limiter = rate_limiter,
+        # scheduler / load 的上限跟著 LLM 實際容量走（router = 各 backend 加總）
+        max_in_flight = llm.max_concurrency,
+        llm = llm,
+    )
+    return AppServices(
+        triage_emotion = EmotionAnalyzer(),
+        queue = queue,
+        rate_limiter = rate_limiter,
+        worker = worker,
+        loop_monitor = LoopLagMonitor(
+            interval_sec = 0.1,
+            block_threshold_sec = float(os.getenv("LOOP_BLOCK_THRESHOLD_SEC", "0.2")),
+        ),
+    )
+
 
-_worker_task: asyncio.Task | None = None
+def get_services(conn: HTTPConnection) -> AppServices:
+    return conn.app.state.services
+
+
+def caller_id(conn: HTTPConnection) -> str:
+    """
+    呼叫者身分（rate limit bucket / session 情緒狀態的 key）。
+    不能用 request body 裡的 user_id（可以亂換 / 冒用別人的）：
+    有合法 JWT 就用 token 的 sub（跟 /ws/chat 共用同一份狀態），否則用 client IP
+    """
+    scheme, _, token = conn.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            sub = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            sub = None
+        if sub:
+            return sub
+    host = conn.client.host if conn.client else "unknown"
+    return f"ip:{host}"
 
 
 # ============ app lifecycle ============
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global _worker_task
-    _worker_task = asyncio.create_task(worker.run_forever())
+    # ---- DB ----
+    if app.state.init_db:
+        init_db()
+
+    # ---- services ----
+    services = build_services(app.state.llm_backend)
+    app.state.services = services
+
+    services.loop_monitor.start()
+    worker_task = asyncio.create_task(services.worker.run_forever())
     try:
         yield
     finally:
-        # MVP: 先不做 cancel / cleanup，避免把事情複雜化
-        # 之後我們會在這裡加 graceful shutdown
-        pass
-
-
-app = FastAPI(
-    title = "Emotion Chat (OS-style)",
-    lifespan = lifespan
-)
+        # graceful shutdown: 停掉背景 worker
+        worker_task.cancel()
+        try:
+            await worker_task
+        except asyncio.CancelledError:
+            pass
+        await services.loop_monitor.stop()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins = ["*"],
-    allow_credentials = True,
-    allow_methods = ["*"],
-    allow_headers = ["*"],
-)
 
-# ============ Router ============
-app.include_router(auth_router)
+chat_router = APIRouter()
 
 
 # ============ schemas ============
 class ChatRequest(BaseModel):
     user_id: str
     message: str
+    session_id: Optional[str] = None
 
 
 # ============ basic endpoints ============
-@app.get("/health")
-def health():
-    return {"ok": True, "queue_size": queue.qsize()}
-
+@chat_router.get("/health")
+def health(request: Request):
+    services = get_services(request)
+    load = services.worker.load.snapshot()
+    return {
+        "ok": True,
+        "queue_size": services.queue.qsize(),
+        "in_flight": load.in_flight,
+        "ttft_ms": round(load.ttft_ms, 1),
+        "load_pressure": round(load.pressure(), 3),
+        "llm_preemptions": services.worker.scheduler.stats.preemptions,
+    }
+
+
+@chat_router.post("/chat")
+async def chat(req: ChatRequest, request: Request):
+    services = get_services(request)
+
+    # body 的 user_id 不可信：rate limit / session 情緒都以 JWT user 或 client IP 為準
+    owner = caller_id(request)
 
-@app.post("/chat")
-async def chat(req: ChatRequest):
     job_id = str(uuid.uuid4())
     job = ChatJob(
         job_id = job_id,
-        user_id = req.user_id,
+        user_id = owner,
         message = req.message
     )
 
-    # triage: 先粗估情緒嚴重程度 -> priority
-    emo = triage_emotion.analyze(req.message)
-
-    if emo.label in ("sad", "angry", "anxious") and emo.intensity >= 0.6:
-        priority = 1
-    elif emo.label in ("sad", "angry", "anxious"):
-        priority = 3
-    else:
-        priority = 8
-
-    await queue.put(job, priority=priority)
+    # triage: 先粗估情緒嚴重程度 -> priority（這一則 + 目前為止的 session 狀態）
+    session_id = req.session_id or owner
+    tracker = services.worker.emotion_states
+    with span("triage"):
+        emo = services.triage_emotion.analyze(req.message)
+        priority = triage_priority(emo, tracker.get(owner, session_id))
+    job.priority = priority
+
+    # rate limit: 急件走額度較大的 urgent bucket
+    decision = services.rate_limiter.check_request(owner, priority)
+    if not decision.allowed:
+        raise HTTPException(
+            status_code = 429,
+            detail = decision.reason,
+            headers = {"Retry-After": str(max(1, round(decision.retry_after)))},
+        )
+
+    # 被擋掉的 request 不算進 session 情緒
+    tracker.observe(owner, session_id, emo)
+
+    with span("enqueue"):
+        await services.queue.put(job, priority=priority)
     return {"job_id": job_id, "priority": priority}
 
 
-@app.get("/result/{job_id}")
-def get_result(job_id: str):
+@chat_router.get("/result/{job_id}")
+def get_result(job_id: str, request: Request):
     """
     Polling endpoint: client asks for result by job_id
     """
-    result = worker.get_result(job_id)
+    result = get_services(request).worker.get_result(job_id)
     if result is None:
         # 202 = 已受理但尚未完成
         raise HTTPException(status_code=202, detail="Processing")
     return result
 
 
+# ============ monitoring (admin only) ============
+# 含 user_id / 情緒風險分數 / backend URL，不能公開
+monitor_router = APIRouter(
+    prefix = "/monitor",
+    tags = ["monitor"],
+    dependencies = [Depends(get_admin_user)],
+)
+
+
+@monitor_router.get("/emotion-states")
+def emotion_states(
+    request: Request,
+    limit: int = Query(20, ge=1, le=500),
+    min_risk: float = Query(0.0, ge=0.0, le=1.0),
+):
+    """
+    哪些 session 正在往危機方向走（依 risk 排序）
+    """
+    tracker = get_services(request).worker.emotion_states
+    return {
+        "tracked_sessions": len(tracker),
+        "sessions": tracker.trending(limit=limit, min_risk=min_risk),
+    }
+
+
+@monitor_router.get("/llm-backends")
+def llm_backends(request: Request):
+    """
+    每個 LLM backend 的 TTFT / error rate / in-flight（只有 router 模式才有多個）
+    """
+    llm = get_services(request).worker.llm
+    stats = getattr(llm, "stats", None)
+    return {"backends": stats() if callable(stats) else []}
+
+
+@monitor_router.get("/scheduler")
+def llm_scheduler(request: Request):
+    """
+    LLM slot 使用狀況、搶佔次數、急件等待時間 / 預估省下的延遲
+    """
+    return get_services(request).worker.scheduler.snapshot()
+
+
 # ============ SSE ============
-@app.get("/stream/{job_id}")
-async def stream_result(job_id: str):
+@chat_router.get("/stream/{job_id}")
+async def stream_result(job_id: str, request: Request):
+    worker = get_services(request).worker
+
     # 如果結果已經存在，直接回一次就好
     result = worker.get_result(job_id)
     if result is not None:
@@ -139,8 +271,9 @@ async def stream_result(job_id: str):
 
 
 # ============ WebSocket (Streaming version) ============
-@app.websocket("/ws/chat")
+@chat_router.websocket("/ws/chat")
 async def websocket_chat(ws: WebSocket, token: str = Query(...)):
+    services = get_services(ws)
     await ws.accept()
     
     try:
@@ -178,16 +311,27 @@ async def websocket_chat(ws: WebSocket, token: str = Query(...)):
                 message = message
             )
 
-            # emotion triage -> priority
-            emo = triage_emotion.analyze(message)
-            if emo.label in ("sad", "angry", "anxious") and emo.intensity >= 0.6:
-                priority = 1
-            elif emo.label in ("sad", "angry", "anxious"):
-                priority = 3
-            else:
-                priority = 8
+            # emotion triage -> priority（這一則 + 目前為止的 session 狀態）
+            tracker = services.worker.emotion_states
+            emo = services.triage_emotion.analyze(message)
+            priority = triage_priority(emo, tracker.get(user_id, session_id))
+            job.priority = priority
+
+            # rate limit
+            decision = services.rate_limiter.check_request(user_id, priority)
+            if not decision.allowed:
+                await ws.send_json({
+                    "type": "error",
+                    "job_id": job_id,
+                    "message": "rate limited",
+                    "reason": decision.reason,
+                    "retry_after": decision.retry_after,
+                })
+                continue
 
-            await queue.put(job, priority=priority)
+            # 被擋掉的訊息不算進 session 情緒
+            tracker.observe(user_id, session_id, emo)
+            await services.queue.put(job, priority=priority)
 
             # ACK
             await ws.send_json({
@@ -199,7 +343,7 @@ async def websocket_chat(ws: WebSocket, token: str = Query(...)):
 
             # Streaming Reply（✅ 傳入 session_id）
             try:
-                async for chunk in worker.stream_reply(job, session_id):
+                async for chunk in services.worker.stream_reply(job, session_id):
                     await ws.send_json({
                         "type": "stream",
                         "job_id": job_id,
@@ -230,4 +374,52 @@ async def websocket_chat(ws: WebSocket, token: str = Query(...)):
     except Exception as e:
         print("WS: server error", repr(e))
         await ws.close(code=1011)
-    
+
+    finally:
+        # session_id 只活在這條連線：斷線後不會再有人讀它的情緒狀態
+        services.worker.emotion_states.drop(user_id, session_id)
+
+
+# ============ app factory ============
+def create_app(
+    llm_backend: Optional[str] = None,
+    init_database: bool = True,
+) -> FastAPI:
+    """
+    Application factory.
+
+    llm_backend: "openai" | "mock"（預設讀 EMOTION_CHAT_LLM，沒設就是 openai）
+    - 建 app 本身不碰 DB / LLM，全部延後到 lifespan startup
+    - scale out 時可用 EMOTION_CHAT_LLM=mock 快速開 process
+
+    uvicorn backend.app.main:app
+    uvicorn --factory backend.app.main:create_app
+    """
+    app = FastAPI(
+        title = "Emotion Chat (OS-style)",
+        lifespan = lifespan
+    )
+    app.state.llm_backend = llm_backend or os.getenv("EMOTION_CHAT_LLM", "openai")
+    app.state.init_db = init_database
+    app.state.traces = TraceStore()
+
+    app.add_middleware(RequestTraceMiddleware, store=app.state.traces)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins = ["*"],
+        allow_credentials = True,
+        allow_methods = ["*"],
+        allow_headers = ["*"],
+    )
+
+    # ============ Router ============
+    app.include_router(auth_router)
+    app.include_router(history_router)
+    app.include_router(admin_router)
+    app.include_router(monitor_router)
+    app.include_router(chat_router)
+
+    return app
+
+
+app = create_app()
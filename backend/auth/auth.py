@@ -1,3 +1,4 @@
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -9,6 +10,7 @@ from sqlalchemy.orm import Session
 
 from backend.db.base import SessionLocal
 from backend.db.models import User
+from backend.core.diagnostics import span
 
 # ======== Set Up ========
 SECRET_KEY = "CHANGE_ME_LATER"
@@ -54,7 +56,22 @@ def get_current_user(
     except JWTError:
         raise HTTPException(status_code=401)
     
-    user = db.query(User).filter(User.id == user_id).first()
+    with span("auth.db"):
+        user = db.query(User).filter(User.id == user_id).first()
     if not user:
         raise HTTPException(status_code=401)
     return user
+
+# ======== Admin ========
+def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    """
+    ADMIN_USERNAMES: 逗號分隔的 username 清單（沒設定 = 沒有 admin）
+    """
+    admins = {
+        name.strip()
+        for name in os.getenv("ADMIN_USERNAMES", "").split(",")
+        if name.strip()
+    }
+    if user.username not in admins:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN)
+    return user
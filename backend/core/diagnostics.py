@@ -0,0 +1,292 @@
+"""
+Event-loop diagnostics.
+
+- LoopLagMonitor: 持續量測 event loop lag；另一條 watchdog thread 發現 loop
+  卡住超過門檻時，抓下 loop thread 當下的 stack（找出是誰在 block）
+- sample_profile(): on-demand sampling profiler（collapsed stacks，可直接餵 flamegraph）
+- RequestTrace / span(): 用 contextvars 記錄每個 request 內各階段花的時間
+"""
+import asyncio
+import contextvars
+import sys
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+
+# ============ loop lag + blocking detector ============
+@dataclass
+class BlockedSample:
+    detected_at: float
+    blocked_ms: float      # 還在卡 = 目前為止；恢復後 = 實際卡住的時間
+    stack: List[str]
+    ongoing: bool = True
+
+
+class LoopLagMonitor:
+    """
+    - tick coroutine 每 interval 醒來一次，lag = 實際睡的時間 - interval
+    - watchdog thread 看 heartbeat：超過 interval + block_threshold 沒更新，
+      代表 loop 正被某個 callback 卡住，立刻抓 loop thread 的 stack
+    """
+
+    def __init__(
+        self,
+        interval_sec: float = 0.1,
+        block_threshold_sec: float = 0.2,
+        max_samples: int = 50,
+    ):
+        self.interval_sec = interval_sec
+        self.block_threshold_sec = block_threshold_sec
+
+        self.lag_ms = 0.0          # EWMA
+        self.max_lag_ms = 0.0
+        self.ticks = 0
+        self.recent_lag_ms: Deque[float] = deque(maxlen=600)
+        self.blocked: Deque[BlockedSample] = deque(maxlen=max_samples)
+        self.blocked_total = 0
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def loop_thread_id(self) -> Optional[int]:
+        return self._loop_thread_id
+
+    def start(self) -> None:
+        """必須在 event loop 裡呼叫（lifespan startup）"""
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(
+            target = self._watch, name = "loop-watchdog", daemon = True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+
+    async def _tick(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval_sec)
+            now = time.monotonic()
+            lag = max(0.0, (now - t0 - self.interval_sec) * 1000.0)
+
+            self.ticks += 1
+            self.lag_ms += 0.2 * (lag - self.lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag)
+            self.recent_lag_ms.append(lag)
+            self._heartbeat = now
+
+    def _watch(self) -> None:
+        limit = self.interval_sec + self.block_threshold_sec
+        captured_for = None  # 同一次 block 只抓一次 stack
+        current: Optional[BlockedSample] = None
+        while not self._stop.wait(self.block_threshold_sec / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat
+
+            if current is not None:
+                if heartbeat != captured_for:
+                    # loop 回來了：下一個 heartbeat 跟卡住前那個的間隔就是實際卡住的時間
+                    current.blocked_ms = (heartbeat - captured_for - self.interval_sec) * 1000.0
+                    current.ongoing = False
+                    current = None
+                else:
+                    current.blocked_ms = (stalled - self.interval_sec) * 1000.0
+
+            if stalled < limit or captured_for == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            captured_for = heartbeat
+            self.blocked_total += 1
+            current = BlockedSample(
+                detected_at = time.time(),
+                blocked_ms = (stalled - self.interval_sec) * 1000.0,
+                stack = traceback.format_stack(frame),
+            )
+            self.blocked.append(current)
+
+    def snapshot(self) -> dict:
+        recent = sorted(self.recent_lag_ms)
+        p99 = recent[min(len(recent) - 1, int(0.99 * len(recent)))] if recent else 0.0
+        return {
+            "lag_ms": round(self.lag_ms, 2),
+            "lag_p99_ms": round(p99, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "ticks": self.ticks,
+            "blocked_total": self.blocked_total,
+            "block_threshold_ms": self.block_threshold_sec * 1000.0,
+        }
+
+    def blocked_samples(self) -> List[dict]:
+        return [
+            {
+                "detected_at": s.detected_at,
+                "blocked_ms": round(s.blocked_ms, 1),
+                "ongoing": s.ongoing,
+                "stack": s.stack,
+            }
+            for s in reversed(self.blocked)
+        ]
+
+
+# ============ sampling profiler ============
+_profile_lock = threading.Lock()
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_profile(thread_id: int, seconds: float = 5.0, interval_sec: float = 0.005) -> dict:
+    """
+    Blocking：在另一條 thread 跑（asyncio.to_thread），每 interval 抓一次
+    thread_id 的 stack，回傳 collapsed stacks 統計。同時間只允許一個 profile。
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("profile already running")
+    try:
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stacks[_collapse(frame)] += 1
+                samples += 1
+            time.sleep(interval_sec)
+        return {
+            "seconds": seconds,
+            "interval_ms": interval_sec * 1000.0,
+            "samples": samples,
+            "top": [
+                {"stack": stack, "samples": n, "ratio": round(n / samples, 4)}
+                for stack, n in stacks.most_common(30)
+            ],
+            # flamegraph.pl / speedscope 可直接吃的格式
+            "collapsed": "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()),
+        }
+    finally:
+        _profile_lock.release()
+
+
+# ============ per-request spans ============
+@dataclass
+class RequestTrace:
+    request_id: str
+    method: str
+    path: str
+    started_at: float = field(default_factory=time.perf_counter)
+    spans: Dict[str, float] = field(default_factory=dict)
+    total_ms: float = 0.0
+    status: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "total_ms": round(self.total_ms, 2),
+            "spans_ms": {k: round(v, 2) for k, v in self.spans.items()},
+        }
+
+
+current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+@contextmanager
+def span(name: str):
+    """
+    記錄一段程式碼的耗時到目前 request 的 trace；不在 request 裡就什麼都不做。
+    同名 span 會累加。
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans[name] = trace.spans.get(name, 0.0) + (time.perf_counter() - t0) * 1000.0
+
+
+class TraceStore:
+    def __init__(self, max_recent: int = 200, max_slow: int = 50):
+        self.recent: Deque[RequestTrace] = deque(maxlen=max_recent)
+        self.slow: List[RequestTrace] = []   # 依 total_ms 保留最慢的 N 筆
+        self.max_slow = max_slow
+
+    def add(self, trace: RequestTrace) -> None:
+        self.recent.append(trace)
+        if len(self.slow) < self.max_slow:
+            self.slow.append(trace)
+        elif trace.total_ms > self.slow[-1].total_ms:
+            self.slow[-1] = trace
+        else:
+            return
+        self.slow.sort(key=lambda t: t.total_ms, reverse=True)
+
+
+class RequestTraceMiddleware:
+    """
+    Pure ASGI middleware（BaseHTTPMiddleware 會破壞 contextvars / streaming）。
+    只追 HTTP request；WebSocket 是長連線，不適合整條當一個 span。
+    """
+
+    def __init__(self, app, store: TraceStore):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(
+            request_id = uuid.uuid4().hex[:12],
+            method = scope.get("method", ""),
+            path = scope.get("path", ""),
+        )
+        token = current_trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            trace.total_ms = (time.perf_counter() - trace.started_at) * 1000.0
+            current_trace.reset(token)
+            self.store.add(trace)
@@ -0,0 +1,148 @@
+import heapq
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from backend.services.emotion import EmotionResult
+from backend.services.policy import urgency_score
+
+
+EMOTION_KEYS = ("sadness", "anger", "anxiety", "calm")
+
+
+@dataclass
+class EmotionState:
+    """
+    Rolling emotion state of one session.
+
+    - fuzzy: 各情緒分數的 EWMA
+    - urgency: urgency score 的非對稱 EWMA（上升快、回落慢）
+    - trend: urgency 變化量的 EWMA（> 0 代表越來越糟）
+    - peak_urgency: 近期最高 urgency，每一輪乘上 peak_decay 慢慢退
+    """
+    fuzzy: Dict[str, float] = field(default_factory=lambda: dict.fromkeys(EMOTION_KEYS, 0.0))
+    urgency: float = 0.0
+    trend: float = 0.0
+    peak_urgency: float = 0.0
+    turns: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    def risk(self) -> float:
+        """
+        排程用的風險分數：目前水位 + 上升趨勢（下降趨勢不扣分，避免一句中性話就解除），
+        且不低於近期的 peak：危機訊息之後的幾句中性話不會馬上掉回 priority 8
+        """
+        return min(1.0, max(self.urgency + max(0.0, self.trend), self.peak_urgency))
+
+    def to_dict(self) -> dict:
+        return {
+            "fuzzy": {k: round(v, 3) for k, v in self.fuzzy.items()},
+            "urgency": round(self.urgency, 3),
+            "trend": round(self.trend, 3),
+            "risk": round(self.risk(), 3),
+            "peak_urgency": round(self.peak_urgency, 3),
+            "turns": self.turns,
+            "updated_at": self.updated_at,
+        }
+
+
+class EmotionStateTracker:
+    """
+    Per-session rolling emotion state, maintained alongside SessionStore.
+
+    每一輪只用「上一輪的 state + 這一輪的 EmotionResult」更新（O(1)），
+    不需要重新分析整段歷史。
+
+    key: (user_id, session_id)；_states 依最後更新時間排序，prune_idle 只動最舊的一端
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        urgency_rise_alpha: float = 0.5,
+        urgency_decay_alpha: float = 0.15,
+        trend_alpha: float = 0.5,
+        peak_decay: float = 0.9,
+        idle_ttl_sec: float = 3600.0,
+    ):
+        """
+        alpha: fuzzy 分數 EWMA 中新一輪的權重；越小越「記得」過去的情緒
+        urgency_rise_alpha / urgency_decay_alpha:
+            urgency 上升時反應快、下降時慢慢退，避免一句中性話就解除警戒
+        peak_decay: 近期 peak 每一輪的保留比例（risk 的下限）；
+            0.9 = 一則 0.81 的危機訊息之後，約 7 輪內都還在 priority 3 以上
+        """
+        self.alpha = alpha
+        self.urgency_rise_alpha = urgency_rise_alpha
+        self.urgency_decay_alpha = urgency_decay_alpha
+        self.trend_alpha = trend_alpha
+        self.peak_decay = peak_decay
+        self.idle_ttl_sec = idle_ttl_sec
+
+        self._states: "OrderedDict[Tuple[str, str], EmotionState]" = OrderedDict()
+
+    def observe(self, user_id: str, session_id: str, emotion: EmotionResult) -> EmotionState:
+        key = (user_id, session_id)
+        state = self._states.get(key)
+        current = urgency_score(emotion.fuzzy)
+
+        if state is None:
+            # 第一輪：直接用這一輪的值當起點
+            state = EmotionState(
+                fuzzy = {k: emotion.fuzzy.get(k, 0.0) for k in EMOTION_KEYS},
+                urgency = current,
+                peak_urgency = current,
+                turns = 1,
+            )
+            self._states[key] = state
+            return state
+
+        self._states.move_to_end(key)
+        a = self.alpha
+        for k in EMOTION_KEYS:
+            state.fuzzy[k] += a * (emotion.fuzzy.get(k, 0.0) - state.fuzzy[k])
+
+        prev_urgency = state.urgency
+        ua = self.urgency_rise_alpha if current > prev_urgency else self.urgency_decay_alpha
+        state.urgency += ua * (current - state.urgency)
+        state.trend += self.trend_alpha * ((state.urgency - prev_urgency) - state.trend)
+        state.peak_urgency = max(state.peak_urgency * self.peak_decay, current)
+        state.turns += 1
+        state.updated_at = time.time()
+        return state
+
+    def get(self, user_id: str, session_id: str) -> Optional[EmotionState]:
+        return self._states.get((user_id, session_id))
+
+    def drop(self, user_id: str, session_id: str) -> None:
+        self._states.pop((user_id, session_id), None)
+
+    # ============ monitoring ============
+    def trending(self, limit: int = 20, min_risk: float = 0.0) -> List[dict]:
+        """風險最高的前 N 個 session（給監控用）"""
+        candidates = (
+            (state.risk(), key, state)
+            for key, state in self._states.items()
+            if state.risk() >= min_risk
+        )
+        top = heapq.nlargest(limit, candidates, key=lambda item: item[0])
+        return [
+            {"user_id": user_id, "session_id": session_id, **state.to_dict()}
+            for _, (user_id, session_id), state in top
+        ]
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def prune_idle(self, max_items: int = 1000) -> int:
+        """從最久沒更新的開始移除，碰到還活著的就停；每次最多 max_items 個"""
+        now = time.time()
+        removed = 0
+        while self._states and removed < max_items:
+            state = next(iter(self._states.values()))
+            if now - state.updated_at <= self.idle_ttl_sec:
+                break
+            self._states.popitem(last=False)
+            removed += 1
+        return removed
@@ -0,0 +1,99 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from backend.core.task_queue import TaskQueue
+
+
+@dataclass
+class LoadSnapshot:
+    queue_depth: int
+    queue_capacity: int
+    in_flight: int
+    max_in_flight: int
+    ttft_ms: float
+    ttft_target_ms: float
+
+    def pressure(self) -> float:
+        """
+        0.0 = idle, 1.0 = saturated（可以 > 1）
+        取三個訊號中最糟的那個
+
+        TTFT 只在有負載（queue 有東西或有 stream 在跑）時才算：
+        idle 時慢的 TTFT 是過去的事，不該讓新 request 被降級
+        """
+        busy = self.queue_depth > 0 or self.in_flight > 0
+        signals = [
+            self.queue_depth / self.queue_capacity if self.queue_capacity > 0 else 0.0,
+            self.in_flight / self.max_in_flight if self.max_in_flight > 0 else 0.0,
+            self.ttft_ms / self.ttft_target_ms if busy and self.ttft_target_ms > 0 else 0.0,
+        ]
+        return max(signals)
+
+
+class LoadMonitor:
+    """
+    Live load signals for the scheduler / policy.
+
+    - queue depth: 直接讀 TaskQueue
+    - in-flight: 目前正在跑的 LLM streams
+    - TTFT: time-to-first-token 的 EWMA（最近的值權重較高），
+      沒有新樣本時以 ttft_half_life_sec 衰減回 0。否則 TTFT 一高就全部降級成罐頭回覆，
+      不再呼叫 LLM，EWMA 也永遠拿不到新樣本
+    """
+
+    def __init__(
+        self,
+        queue: Optional[TaskQueue] = None,
+        max_in_flight: int = 8,
+        ttft_target_ms: float = 1500.0,
+        ttft_alpha: float = 0.2,
+        ttft_half_life_sec: float = 30.0,
+    ):
+        self.queue = queue
+        self.max_in_flight = max_in_flight
+        self.ttft_target_ms = ttft_target_ms
+        self.ttft_alpha = ttft_alpha
+        self.ttft_half_life_sec = ttft_half_life_sec
+
+        self.in_flight = 0
+        self._ttft_ms = 0.0
+        self._ttft_at = time.monotonic()
+
+    @property
+    def ttft_ms(self) -> float:
+        """EWMA，依距離上一個樣本的時間衰減"""
+        if self._ttft_ms == 0.0 or self.ttft_half_life_sec <= 0:
+            return self._ttft_ms
+        age = time.monotonic() - self._ttft_at
+        return self._ttft_ms * 0.5 ** (age / self.ttft_half_life_sec)
+
+    @ttft_ms.setter
+    def ttft_ms(self, value: float) -> None:
+        self._ttft_ms = value
+        self._ttft_at = time.monotonic()
+
+    def stream_started(self) -> float:
+        self.in_flight += 1
+        return time.perf_counter()
+
+    def first_token(self, started_at: float) -> None:
+        sample = (time.perf_counter() - started_at) * 1000.0
+        current = self.ttft_ms
+        if current == 0.0:
+            self.ttft_ms = sample
+        else:
+            self.ttft_ms = current + self.ttft_alpha * (sample - current)
+
+    def stream_finished(self) -> None:
+        self.in_flight = max(0, self.in_flight - 1)
+
+    def snapshot(self) -> LoadSnapshot:
+        return LoadSnapshot(
+            queue_depth = self.queue.qsize() if self.queue else 0,
+            queue_capacity = self.queue.maxsize() if self.queue else 0,
+            in_flight = self.in_flight,
+            max_in_flight = self.max_in_flight,
+            ttft_ms = self.ttft_ms,
+            ttft_target_ms = self.ttft_target_ms,
+        )
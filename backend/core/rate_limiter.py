@@ -0,0 +1,188 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class TokenBucket:
+    """
+    Classic token bucket.
+
+    - capacity: 最大可累積量（burst）
+    - refill_per_sec: 每秒補充量
+    - tokens 可以被扣成負數（事後記帳），代表欠款，補回正數前都會被擋
+    """
+    capacity: float
+    refill_per_sec: float
+    tokens: Optional[float] = None
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def __post_init__(self):
+        if self.tokens is None:
+            self.tokens = self.capacity
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_sec)
+            self.updated_at = now
+
+    def try_take(self, amount: float = 1.0, now: Optional[float] = None) -> bool:
+        self._refill(now if now is not None else time.monotonic())
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def charge(self, amount: float, now: Optional[float] = None) -> None:
+        """扣款（允許變負數），用在串流結束後回報實際 token 用量"""
+        self._refill(now if now is not None else time.monotonic())
+        self.tokens -= amount
+
+    def available(self, now: Optional[float] = None) -> float:
+        self._refill(now if now is not None else time.monotonic())
+        return self.tokens
+
+    def retry_after(self, amount: float = 1.0) -> float:
+        """還要等幾秒才湊得到 amount"""
+        missing = amount - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.refill_per_sec
+
+
+@dataclass
+class UserBuckets:
+    requests: TokenBucket
+    llm_tokens: TokenBucket
+    last_seen: float = field(default_factory=time.monotonic)
+    urgent: Optional[TokenBucket] = None  # 第一次有急件時才建立
+
+
+@dataclass
+class RateDecision:
+    allowed: bool
+    reason: str = ""
+    retry_after: float = 0.0
+
+
+class RateLimiter:
+    """
+    Per-user in-memory rate limiter.
+
+    每個 user 的 bucket：
+    - requests: requests / sec
+    - llm_tokens: LLM tokens / minute（串流結束後以實際用量扣款）
+    - urgent: priority <= urgent_priority 的情緒急件走這個額度較大的 bucket，
+      不看 requests / llm_tokens（token 仍會記帳），避免最需要回應的使用者被擋掉；
+      但不是完全豁免，洗危機字眼也只能拿到 urgent 的額度
+    所有操作都是 O(1)（dict lookup + 常數運算）；_buckets 依 last_seen 排序，
+    prune_idle 只從最舊的一端拿掉過期的，不掃整個 dict。
+    """
+
+    def __init__(
+        self,
+        requests_per_sec: float = 1.0,
+        request_burst: int = 5,
+        llm_tokens_per_min: int = 4000,
+        urgent_priority: int = 1,
+        urgent_requests_per_sec: float = 3.0,
+        urgent_burst: int = 20,
+        idle_ttl_sec: float = 600.0,
+    ):
+        self.requests_per_sec = requests_per_sec
+        self.request_burst = request_burst
+        self.llm_tokens_per_min = llm_tokens_per_min
+        self.urgent_priority = urgent_priority
+        self.urgent_requests_per_sec = urgent_requests_per_sec
+        self.urgent_burst = urgent_burst
+        self.idle_ttl_sec = idle_ttl_sec
+
+        self._buckets: "OrderedDict[str, UserBuckets]" = OrderedDict()
+
+    def _get(self, user_id: str, now: float) -> UserBuckets:
+        b = self._buckets.get(user_id)
+        if b is None:
+            b = UserBuckets(
+                requests = TokenBucket(
+                    capacity = self.request_burst,
+                    refill_per_sec = self.requests_per_sec,
+                    updated_at = now,
+                ),
+                llm_tokens = TokenBucket(
+                    capacity = self.llm_tokens_per_min,
+                    refill_per_sec = self.llm_tokens_per_min / 60.0,
+                    updated_at = now,
+                ),
+                last_seen = now,
+            )
+            self._buckets[user_id] = b
+        else:
+            self._buckets.move_to_end(user_id)
+        b.last_seen = now
+        return b
+
+    def check_request(self, user_id: str, priority: int = 10) -> RateDecision:
+        """
+        在 enqueue 前呼叫。
+        - 情緒急件：只看 urgent bucket
+        - LLM token 欠款中 -> 擋
+        - request bucket 空了 -> 擋
+        """
+        now = time.monotonic()
+        b = self._get(user_id, now)
+
+        if priority <= self.urgent_priority:
+            if b.urgent is None:
+                b.urgent = TokenBucket(
+                    capacity = self.urgent_burst,
+                    refill_per_sec = self.urgent_requests_per_sec,
+                    updated_at = now,
+                )
+            if not b.urgent.try_take(1.0, now):
+                return RateDecision(
+                    allowed = False,
+                    reason = "urgent_rate",
+                    retry_after = b.urgent.retry_after(1.0),
+                )
+            return RateDecision(allowed=True)
+
+        if b.llm_tokens.available(now) <= 0:
+            return RateDecision(
+                allowed = False,
+                reason = "llm_token_budget",
+                retry_after = b.llm_tokens.retry_after(1.0),
+            )
+
+        if not b.requests.try_take(1.0, now):
+            return RateDecision(
+                allowed = False,
+                reason = "request_rate",
+                retry_after = b.requests.retry_after(1.0),
+            )
+
+        return RateDecision(allowed=True)
+
+    def record_llm_tokens(self, user_id: str, tokens: int) -> None:
+        """串流結束後回報實際用量"""
+        if tokens <= 0:
+            return
+        now = time.monotonic()
+        self._get(user_id, now).llm_tokens.charge(tokens, now)
+
+    def prune_idle(self, max_items: int = 1000) -> int:
+        """
+        移除太久沒出現的 user，避免 dict 無限長大。
+        從最久沒出現的開始，碰到第一個還活著的就停；每次最多 max_items 個，
+        每個 request 後呼叫也不會卡住 event loop
+        """
+        now = time.monotonic()
+        removed = 0
+        while self._buckets and removed < max_items:
+            uid, b = next(iter(self._buckets.items()))
+            if now - b.last_seen <= self.idle_ttl_sec:
+                break
+            self._buckets.popitem(last=False)
+            removed += 1
+        return removed
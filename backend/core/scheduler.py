@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass
+class SlotLease:
+    """
+    一個 LLM stream 佔用的 slot。preempted 被設起來時，
+    持有者應該在下一個 chunk 收尾並 release。
+    """
+    job_id: str
+    priority: int
+    granted_at: float = field(default_factory=time.perf_counter)
+    preempted: bool = False
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.granted_at) * 1000.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    job_id: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False, default_factory=time.perf_counter)
+    # 不搶佔的話，預估要等多久（最快結束的 stream 剩餘時間）；None = 還沒有樣本可估
+    expected_wait_ms: Optional[float] = field(compare=False, default=None)
+
+
+@dataclass
+class PreemptionStats:
+    preemptions: int = 0
+    critical_grants: int = 0     # 急件拿到 slot 的次數
+    critical_waited: int = 0     # 其中需要排隊的次數
+    waited_ms_total: float = 0.0
+    saved_ms_total: float = 0.0  # 預估等待 - 實際等待（只算有排隊、且估得出來的急件）
+    saved_samples: int = 0
+
+
+class LLMSlotScheduler:
+    """
+    LLM concurrency slots + priority preemption.
+
+    - 最多 max_slots 個 stream 同時跑，滿了就依 priority 排隊（1 = 最先）
+    - 急件（priority <= critical_priority）排隊時，挑一個
+      priority >= min_preemptible_priority 的 stream 標記 preempted，
+      讓它收尾後把 slot 交給急件
+    - priority 用入口 triage 的結果（ChatJob.priority）：priority 1 的危機訊息
+      可以搶一般對話（8）的 slot，priority 3 只排隊不搶
+    - 省下的延遲 = 不搶佔時的預估等待（以完整 stream 的 EWMA 長度估）- 實際等待
+    """
+
+    def __init__(
+        self,
+        max_slots: int = 8,
+        critical_priority: int = 1,
+        min_preemptible_priority: int = 8,
+        duration_alpha: float = 0.2,
+    ):
+        self.max_slots = max_slots
+        self.critical_priority = critical_priority
+        self.min_preemptible_priority = min_preemptible_priority
+        self.duration_alpha = duration_alpha
+
+        self.active: Dict[str, SlotLease] = {}
+        self.stats = PreemptionStats()
+        self.stream_ms = 0.0  # 沒被搶佔的 stream 平均長度（EWMA）
+
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+
+    # ----- acquire / release -----
+    async def acquire(self, job_id: str, priority: int) -> SlotLease:
+        if len(self.active) < self.max_slots and not self._waiters:
+            return self._grant(job_id, priority)
+
+        waiter = _Waiter(
+            priority = priority,
+            seq = next(self._seq),
+            job_id = job_id,
+            future = asyncio.get_running_loop().create_future(),
+            expected_wait_ms = self._expected_wait_ms(),
+        )
+        heapq.heappush(self._waiters, waiter)
+        self._rebalance()
+
+        try:
+            lease = await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 剛好拿到 slot 卻被取消：還回去
+                self.release(waiter.future.result())
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+                heapq.heapify(self._waiters)
+                self._rebalance()
+            raise
+
+        self._record_wait(waiter)
+        return lease
+
+    def release(self, lease: SlotLease) -> None:
+        if self.active.pop(lease.job_id, None) is None:
+            return
+
+        if lease.preempted:
+            self.stats.preemptions += 1
+        else:
+            ms = lease.elapsed_ms()
+            self.stream_ms = ms if self.stream_ms == 0.0 else (
+                self.stream_ms + self.duration_alpha * (ms - self.stream_ms)
+            )
+
+        while self._waiters and len(self.active) < self.max_slots:
+            waiter = heapq.heappop(self._waiters)
+            if waiter.future.done():
+                continue
+            waiter.future.set_result(self._grant(waiter.job_id, waiter.priority))
+        self._rebalance()
+
+    # ----- preemption -----
+    def _rebalance(self) -> None:
+        """
+        讓「被標記 preempted 但還沒收尾」的 stream 數量 = 排隊中的急件數量：
+        不夠就再挑 victim，多了（例如有別的 stream 先結束）就撤銷標記
+        """
+        critical = sum(1 for w in self._waiters if w.priority <= self.critical_priority)
+        pending = [l for l in self.active.values() if l.preempted]
+
+        while len(pending) > critical:
+            # 撤銷最晚開始的那個（它收尾的話損失最少，但能不收尾更好）
+            lease = max(pending, key=lambda l: l.granted_at)
+            lease.preempted = False
+            pending.remove(lease)
+
+        while len(pending) < critical:
+            victim = self._pick_victim()
+            if victim is None:
+                return
+            victim.preempted = True
+            pending.append(victim)
+
+    def _pick_victim(self) -> Optional[SlotLease]:
+        candidates = [
+            l for l in self.active.values()
+            if not l.preempted and l.priority >= self.min_preemptible_priority
+        ]
+        if not candidates:
+            return None
+        # priority 最低的先；同 priority 挑最晚開始的（已送出的內容最少）
+        return max(candidates, key=lambda l: (l.priority, l.granted_at))
+
+    # ----- bookkeeping -----
+    def _grant(self, job_id: str, priority: int) -> SlotLease:
+        lease = SlotLease(job_id=job_id, priority=priority)
+        self.active[job_id] = lease
+        if priority <= self.critical_priority:
+            self.stats.critical_grants += 1
+        return lease
+
+    def _expected_wait_ms(self) -> Optional[float]:
+        if self.stream_ms == 0.0:
+            return None  # 還沒有完整跑完的 stream，估不出剩餘時間
+        if not self.active:
+            return 0.0
+        return min(max(0.0, self.stream_ms - l.elapsed_ms()) for l in self.active.values())
+
+    def _record_wait(self, waiter: _Waiter) -> None:
+        if waiter.priority > self.critical_priority:
+            return
+        waited_ms = (time.perf_counter() - waiter.enqueued_at) * 1000.0
+        self.stats.critical_waited += 1
+        self.stats.waited_ms_total += waited_ms
+        if waiter.expected_wait_ms is not None:
+            self.stats.saved_ms_total += max(0.0, waiter.expected_wait_ms - waited_ms)
+            self.stats.saved_samples += 1
+
+    def snapshot(self) -> dict:
+        s = self.stats
+        return {
+            "max_slots": self.max_slots,
+            "in_flight": len(self.active),
+            "waiting": len(self._waiters),
+            "preempting": sum(1 for l in self.active.values() if l.preempted),
+            "avg_stream_ms": round(self.stream_ms, 1),
+            "preemptions": s.preemptions,
+            "critical_grants": s.critical_grants,
+            "critical_waited": s.critical_waited,
+            "critical_avg_wait_ms": round(s.waited_ms_total / s.critical_waited, 1) if s.critical_waited else 0.0,
+            # None = 還沒有可估計的樣本（不是「省了 0ms」）
+            "latency_saved_ms_total": round(s.saved_ms_total, 1) if s.saved_samples else None,
+            "latency_saved_samples": s.saved_samples,
+        }
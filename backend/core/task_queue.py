@@ -1,6 +1,7 @@
 import asyncio
 import time
 from dataclasses import dataclass, field
+from typing import Optional
 
 @dataclass(order=True)
 class PriorityizedItem:
@@ -13,6 +14,7 @@ class ChatJob:
     job_id: str
     user_id: str
     message: str
+    priority: Optional[int] = None  # 入口 triage 的結果；None = 尚未 triage
 
 class TaskQueue:
     """Async producer/consumer queue."""
@@ -34,5 +36,11 @@ class TaskQueue:
     def task_done(self) -> None:
         self._q.task_done()
     
+    async def join(self) -> None:
+        await self._q.join()
+    
     def qsize(self) -> int:
-        return self._q.qsize()
\ No newline at end of file
+        return self._q.qsize()
+    
+    def maxsize(self) -> int:
+        return self._q.maxsize
@@ -5,9 +5,13 @@ from typing import Dict, Optional
 
 from backend.core.task_queue import TaskQueue, ChatJob
 from backend.services.emotion import EmotionAnalyzer
-from backend.services.policy import PolicyEngine
-from backend.services.llm import OpenAILLMClient
+from backend.services.policy import PolicyEngine, PREEMPTED_WRAP_UP
+from backend.services.llm import LLMClient, OpenAILLMClient
 from backend.core.session_store import SessionStore
+from backend.core.rate_limiter import RateLimiter
+from backend.core.load import LoadMonitor
+from backend.core.emotion_state import EmotionStateTracker
+from backend.core.scheduler import LLMSlotScheduler
 
 
 @dataclass
@@ -36,14 +40,32 @@ class Worker:
             - 最終結果回存
     """
 
-    def __init__(self, queue: TaskQueue, result_ttl_sec: int = 300):
+    def __init__(
+        self,
+        queue: TaskQueue,
+        result_ttl_sec: int = 300,
+        rate_limiter: Optional[RateLimiter] = None,
+        max_in_flight: Optional[int] = None,
+        llm: Optional[LLMClient] = None,
+    ):
+        """
+        max_in_flight: 同時跑的 LLM streams 上限；None = 跟 LLM client 的容量一樣
+        （LLMRouter = 所有 backend 的 max_concurrency 加總）
+        """
         self.queue = queue
+        self.rate_limiter = rate_limiter
+        self.llm = llm if llm is not None else OpenAILLMClient()
+
+        if max_in_flight is None:
+            max_in_flight = self.llm.max_concurrency
+        self.load = LoadMonitor(queue=queue, max_in_flight=max_in_flight)
+        self.scheduler = LLMSlotScheduler(max_slots=max_in_flight)
 
         # --- core services ---
         self.emotion = EmotionAnalyzer()
         self.policy = PolicyEngine()
-        self.llm = OpenAILLMClient()
         self.sessions = SessionStore(max_turns=20)
+        self.emotion_states = EmotionStateTracker()
 
         # --- in-memory result store ---
         self.results: Dict[str, ChatResult] = {}
@@ -52,14 +74,23 @@ class Worker:
         self.result_ttl_sec = result_ttl_sec
 
     # ============ housekeeping ============
-    def _cleanup_expired(self) -> None:
+    def _cleanup_expired(self, max_items: int = 1000) -> None:
+        """
+        每個 reply 結束都會呼叫，所以不能全掃：
+        results 依寫入順序（= created_at 順序）排列，只從最舊的一端移除過期的
+        """
         now = time.time()
-        expired = [
-            k for k, v in self.results.items()
-            if now - v.created_at > self.result_ttl_sec
-        ]
-        for k in expired:
-            self.results.pop(k, None)
+        removed = 0
+        while self.results and removed < max_items:
+            job_id, r = next(iter(self.results.items()))
+            if now - r.created_at <= self.result_ttl_sec:
+                break
+            del self.results[job_id]
+            removed += 1
+
+        if self.rate_limiter is not None:
+            self.rate_limiter.prune_idle()
+        self.emotion_states.prune_idle()
 
     # ============ background worker (queue) ============
     async def run_forever(self) -> None:
@@ -98,6 +129,58 @@ class Worker:
     def clear_event(self, job_id: str) -> None:
         self._events.pop(job_id, None)
 
+    # ============ LLM call (slots + load + token accounting) ============
+    async def _stream_llm(self, job: ChatJob, messages: list[dict], pol):
+        """
+        先跟 scheduler 拿 slot；被急件搶佔時在下一個 chunk 停下，
+        補一句收尾後把 slot 讓出去
+
+        scheduler / LLM router 都用入口 triage 的 priority（job.priority），
+        沒經過 triage 的 job 才用 policy 算的
+        """
+        job_id, user_id = job.job_id, job.user_id
+        priority = job.priority if job.priority is not None else pol.priority
+        usage: dict = {}
+        n_chunks = 0
+        truncated = False
+
+        lease = await self.scheduler.acquire(job_id, priority)
+        started_at = self.load.stream_started()
+        stream = self.llm.stream_chat_messages(
+            messages = messages,
+            max_words = pol.max_words,
+            usage = usage,
+            model = pol.model,
+            priority = priority,
+        )
+        try:
+            async for chunk in stream:
+                if n_chunks == 0:
+                    self.load.first_token(started_at)
+                n_chunks += 1
+                yield chunk
+                if lease.preempted:
+                    truncated = True
+                    break
+        finally:
+            # 提早 break / client 斷線都要關掉上游 stream，不然 slot 會被佔著
+            await stream.aclose()
+            if not truncated:
+                lease.preempted = False  # 標記後才剛好自己跑完，不算搶佔
+            self.scheduler.release(lease)
+            self.load.stream_finished()
+            # ---- token accounting（中斷也要記帳）----
+            # 拿不到 usage 時以 chunk 數粗估（OpenAI 大約一個 chunk 一個 token）
+            if self.rate_limiter is not None:
+                self.rate_limiter.record_llm_tokens(
+                    user_id,
+                    usage.get("total_tokens", n_chunks),
+                )
+
+        if truncated:
+            print(f"Worker: job {job_id} preempted after {n_chunks} chunks")
+            yield PREEMPTED_WRAP_UP
+
     # ============ WebSocket streaming ============
     async def stream_reply(self, job: ChatJob, session_id: str):
         """
@@ -123,7 +206,13 @@ class Worker:
 
         # ---- emotion & policy ----
         emo = self.emotion.analyze(job.message)
-        pol = self.policy.decide(emo)
+        # session state 由入口 triage 更新（observe），這裡只讀，避免同一則訊息算兩次
+        pol = self.policy.decide(
+            emo,
+            load = self.load.snapshot(),
+            session_state = self.emotion_states.get(user_id, session_id),
+            priority = job.priority,
+        )
 
 
         # ---- conversation history ----
@@ -144,12 +233,14 @@ class Worker:
 
 
         # ---- streaming from LLM ----
-        async for chunk in self.llm.stream_chat_messages(
-            messages = messages,
-            max_words = pol.max_words,
-        ):
-            full_reply += chunk
-            yield chunk
+        if pol.canned_reply is not None:
+            # 高負載降級：直接回罐頭訊息，不佔 LLM slot
+            full_reply = pol.canned_reply
+            yield pol.canned_reply
+        else:
+            async for chunk in self._stream_llm(job, messages, pol):
+                full_reply += chunk
+                yield chunk
 
 
         # ---- session: assistant message ----
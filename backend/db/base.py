@@ -14,4 +14,22 @@ SessionLocal = sessionmaker(
     bind = engine,
 )
 
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
+
+
+def init_db() -> None:
+    """
+    建表（idempotent）。
+    不在 import 時執行，由 app lifespan / create_db.py 明確呼叫。
+    """
+    from backend.db import models  # noqa: F401  註冊 models 到 Base.metadata
+    from backend.db.search import ensure_fts
+
+    Base.metadata.create_all(bind=engine)
+
+    # create_all 不會幫「已存在的 table」補 index，舊的 app.db 要手動補
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    ensure_fts(engine)
@@ -1,7 +1,7 @@
 import uuid
 from datetime import datetime, timezone
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 
 from backend.db.base import Base
@@ -33,6 +33,11 @@ class ChatSession(Base):
     user = relationship("User", back_populates="sessions")
     messages = relationship("Message", back_populates="session")
 
+    __table_args__ = (
+        # 列出 user 的 sessions（keyset pagination: created_at, id）
+        Index("ix_sessions_user_created", "user_id", "created_at", "id"),
+    )
+
 class Message(Base):
     __tablename__ = "messages"
 
@@ -43,4 +48,9 @@ class Message(Base):
     created_at = Column(DateTime, 
                         default=lambda: datetime.now(timezone.utc))
 
-    session = relationship("ChatSession", back_populates="messages")
\ No newline at end of file
+    session = relationship("ChatSession", back_populates="messages")
+
+    __table_args__ = (
+        # 列出 session 的 messages（keyset pagination: created_at, id）
+        Index("ix_messages_session_created", "session_id", "created_at", "id"),
+    )
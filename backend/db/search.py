@@ -0,0 +1,139 @@
+"""
+SQLite FTS5 full-text index over messages.content.
+
+- 一般 FTS5 table（自己存一份 content）+ messages_fts_ids 對照 FTS rowid <-> messages.id；
+  messages 的 PK 是 String，隱含 rowid 在 VACUUM 時可能被重編，不能拿來當 key
+- 用 trigger 跟 messages 同步
+- 優先用 trigram tokenizer（中文沒有空白分詞，trigram 才能做子字串搜尋）
+- SQLite 沒編 FTS5 / 不是 SQLite 時，fts_available() = False，呼叫端改用 LIKE
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+FTS_TABLE = "messages_fts"
+FTS_IDS_TABLE = "messages_fts_ids"
+_TRIGGERS = ("messages_fts_ai", "messages_fts_ad", "messages_fts_au")
+
+_fts_available = None
+_fts_tokenizer = None
+
+
+def _create_fts(conn, tokenizer: str) -> None:
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"content, tokenize='{tokenizer}')"
+    ))
+
+
+def _drop_fts(conn) -> None:
+    for name in _TRIGGERS:
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS {FTS_IDS_TABLE}"))
+
+
+def ensure_fts(engine: Engine) -> bool:
+    """建 FTS table + id 對照表 + 同步 triggers（idempotent）；回傳是否可用"""
+    global _fts_available, _fts_tokenizer
+
+    if engine.dialect.name != "sqlite":
+        _fts_available = False
+        return False
+
+    with engine.begin() as conn:
+        row = conn.execute(
+            text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:name"),
+            {"name": FTS_TABLE},
+        ).first()
+        has_ids = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"),
+            {"name": FTS_IDS_TABLE},
+        ).first() is not None
+
+        if row is not None and not has_ids:
+            # 舊版：external-content 直接對 messages 的隱含 rowid，VACUUM 後可能對錯 row
+            _drop_fts(conn)
+            row = None
+
+        if row is not None:
+            _fts_tokenizer = "trigram" if "trigram" in row[0] else "unicode61"
+        else:
+            try:
+                _create_fts(conn, "trigram")
+                _fts_tokenizer = "trigram"
+            except Exception:
+                try:
+                    # SQLite < 3.34 沒有 trigram
+                    _create_fts(conn, "unicode61")
+                    _fts_tokenizer = "unicode61"
+                except Exception:
+                    _fts_available = False
+                    return False
+
+            # FTS rowid <-> messages.id：明確的 INTEGER PRIMARY KEY，VACUUM 不會重編
+            conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {FTS_IDS_TABLE} (
+                    fts_rowid INTEGER PRIMARY KEY,
+                    message_id TEXT NOT NULL UNIQUE
+                )
+            """))
+
+            # 既有資料補進索引
+            conn.execute(text(f"INSERT INTO {FTS_IDS_TABLE}(message_id) SELECT id FROM messages"))
+            conn.execute(text(f"""
+                INSERT INTO {FTS_TABLE}(rowid, content)
+                SELECT f.fts_rowid, m.content
+                FROM {FTS_IDS_TABLE} AS f JOIN messages AS m ON m.id = f.message_id
+            """))
+
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO {FTS_IDS_TABLE}(message_id) VALUES (new.id);
+                INSERT INTO {FTS_TABLE}(rowid, content) VALUES (
+                    (SELECT fts_rowid FROM {FTS_IDS_TABLE} WHERE message_id = new.id),
+                    new.content
+                );
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+                DELETE FROM {FTS_TABLE} WHERE rowid =
+                    (SELECT fts_rowid FROM {FTS_IDS_TABLE} WHERE message_id = old.id);
+                DELETE FROM {FTS_IDS_TABLE} WHERE message_id = old.id;
+            END
+        """))
+        conn.execute(text(f"""
+            CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF id, content ON messages BEGIN
+                UPDATE {FTS_IDS_TABLE} SET message_id = new.id WHERE message_id = old.id;
+                UPDATE {FTS_TABLE} SET content = new.content WHERE rowid =
+                    (SELECT fts_rowid FROM {FTS_IDS_TABLE} WHERE message_id = new.id);
+            END
+        """))
+
+    _fts_available = True
+    return True
+
+
+def fts_available() -> bool:
+    return bool(_fts_available)
+
+
+def fts_can_match(q: str) -> bool:
+    """trigram 每個詞至少要 3 個字元，太短的查詢改走 LIKE"""
+    if not fts_available():
+        return False
+    terms = q.split()
+    if not terms:
+        return False
+    if _fts_tokenizer == "trigram":
+        return all(len(t) >= 3 for t in terms)
+    return True
+
+
+def fts_query(q: str) -> str:
+    """
+    使用者輸入 -> FTS5 MATCH 字串
+    每個詞包成 phrase（"..."），避免 AND / OR / NEAR / * 等語法被注入
+    """
+    terms = [t for t in q.split() if t]
+    return " ".join('"' + t.replace('"', '""') + '"' for t in terms)
@@ -0,0 +1,187 @@
+import base64
+import json
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_, text
+from sqlalchemy.orm import Session
+
+from backend.db.base import SessionLocal
+from backend.db.models import ChatSession, Message
+from backend.db.search import FTS_IDS_TABLE, FTS_TABLE, fts_can_match, fts_query
+
+
+# ======== Cursor ========
+# keyset pagination：cursor = 上一頁最後一筆的 (created_at, id)
+# 下一頁直接 WHERE (created_at, id) > cursor，走 index，不管翻到第幾頁都是 O(page)
+# created_at 可以是 NULL（schema 允許）：SQLite 排序時 NULL 在 ASC 最前面、DESC 最後面
+def encode_cursor(created_at: Optional[datetime], row_id: str) -> str:
+    raw = json.dumps([created_at.isoformat() if created_at else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], str]:
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return (
+            datetime.fromisoformat(created_at) if created_at is not None else None,
+            str(row_id),
+        )
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after(column_created, column_id, cursor: str, descending: bool):
+    created_at, row_id = decode_cursor(cursor)
+    if created_at is None:
+        if descending:
+            # NULL 已經在最後：只剩同為 NULL、id 更小的
+            return and_(column_created.is_(None), column_id < row_id)
+        return or_(
+            column_created.isnot(None),
+            and_(column_created.is_(None), column_id > row_id),
+        )
+    if descending:
+        return or_(
+            column_created < created_at,
+            and_(column_created == created_at, column_id < row_id),
+            column_created.is_(None),
+        )
+    return or_(
+        column_created > created_at,
+        and_(column_created == created_at, column_id > row_id),
+    )
+
+
+def _page(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    # 多撈一筆判斷是否還有下一頁
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, encode_cursor(last.created_at, last.id)
+    return rows, None
+
+
+# ======== Sessions ========
+def list_sessions(
+    db: Session,
+    user_id: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+) -> Tuple[List[ChatSession], Optional[str]]:
+    """最新的 session 在前（走 ix_sessions_user_created）"""
+    q = db.query(ChatSession).filter(ChatSession.user_id == user_id)
+    if cursor:
+        q = q.filter(_after(ChatSession.created_at, ChatSession.id, cursor, descending=True))
+    rows = (
+        q.order_by(ChatSession.created_at.desc(), ChatSession.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    return _page(rows, limit)
+
+
+def get_owned_session(db: Session, user_id: str, session_id: str) -> ChatSession:
+    s = (
+        db.query(ChatSession)
+        .filter(ChatSession.id == session_id, ChatSession.user_id == user_id)
+        .first()
+    )
+    if not s:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return s
+
+
+# ======== Messages ========
+def list_messages(
+    db: Session,
+    session_id: str,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+) -> Tuple[List[Message], Optional[str]]:
+    """預設由舊到新（走 ix_messages_session_created）"""
+    q = db.query(Message).filter(Message.session_id == session_id)
+    if cursor:
+        q = q.filter(_after(Message.created_at, Message.id, cursor, descending))
+    if descending:
+        q = q.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        q = q.order_by(Message.created_at.asc(), Message.id.asc())
+    return _page(q.limit(limit + 1).all(), limit)
+
+
+def iter_export(session_id: str, batch_size: int = 1000) -> Iterator[str]:
+    """
+    NDJSON export（一行一則 message）。
+    自己開 DB session：StreamingResponse 在 endpoint return 之後才開始迭代，
+    不能依賴 request scope 的 get_db。
+    yield_per：server-side 分批 fetch，記憶體不跟 session 長度成正比。
+    """
+    db = SessionLocal()
+    try:
+        q = (
+            db.query(Message)
+            .filter(Message.session_id == session_id)
+            .order_by(Message.created_at.asc(), Message.id.asc())
+            .yield_per(batch_size)
+        )
+        for m in q:
+            yield json.dumps({
+                "id": m.id,
+                "role": m.role,
+                "content": m.content,
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+            }, ensure_ascii=False) + "\n"
+    finally:
+        db.close()
+
+
+# ======== Search ========
+def search_messages(
+    db: Session,
+    user_id: str,
+    q: str,
+    limit: int = 20,
+    engine: Optional[str] = None,
+) -> Tuple[List[dict], str]:
+    """
+    FTS5 可用時用 MATCH（依 bm25 排序），否則 fallback 到 LIKE（掃 user 的所有 messages）
+    engine: None = 自動選擇；"fts5" / "like" 強制指定（benchmark 用）
+    回傳 (items, 實際使用的 engine)
+    """
+    if engine is None:
+        engine = "fts5" if fts_can_match(q) else "like"
+
+    if engine == "fts5":
+        rows = db.execute(
+            text(f"""
+                SELECT m.id, m.session_id, m.role, m.content, m.created_at
+                FROM {FTS_TABLE}
+                JOIN {FTS_IDS_TABLE} AS f ON f.fts_rowid = {FTS_TABLE}.rowid
+                JOIN messages AS m ON m.id = f.message_id
+                JOIN sessions AS s ON s.id = m.session_id
+                WHERE {FTS_TABLE} MATCH :match AND s.user_id = :user_id
+                ORDER BY {FTS_TABLE}.rank
+                LIMIT :limit
+            """),
+            {"match": fts_query(q), "user_id": user_id, "limit": limit},
+        ).mappings().all()
+        return [dict(r) for r in rows], engine
+
+    like = db.query(Message).join(ChatSession).filter(ChatSession.user_id == user_id)
+    for term in q.split():
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        like = like.filter(Message.content.like(f"%{escaped}%", escape="\\"))
+    rows = like.order_by(Message.created_at.desc()).limit(limit).all()
+    return [
+        {
+            "id": m.id,
+            "session_id": m.session_id,
+            "role": m.role,
+            "content": m.content,
+            "created_at": m.created_at,
+        }
+        for m in rows
+    ], engine
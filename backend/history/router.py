@@ -0,0 +1,66 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from backend.auth.auth import get_db, get_current_user
+from backend.db.models import User
+from backend.history.history import (
+    list_sessions,
+    get_owned_session,
+    list_messages,
+    iter_export,
+    search_messages,
+)
+from backend.history.schemas import SessionPage, MessagePage, SearchResponse
+
+router = APIRouter(prefix="/history", tags=["history"])
+
+@router.get("/sessions", response_model=SessionPage)
+def sessions(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    items, next_cursor = list_sessions(db, user.id, limit=limit, cursor=cursor)
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/sessions/{session_id}/messages", response_model=MessagePage)
+def messages(
+    session_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    get_owned_session(db, user.id, session_id)
+    items, next_cursor = list_messages(
+        db, session_id, limit=limit, cursor=cursor, descending=(order == "desc")
+    )
+    return {"items": items, "next_cursor": next_cursor}
+
+@router.get("/sessions/{session_id}/export")
+def export(
+    session_id: str,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    get_owned_session(db, user.id, session_id)
+    return StreamingResponse(
+        iter_export(session_id),
+        media_type = "application/x-ndjson",
+        headers = {"Content-Disposition": f'attachment; filename="{session_id}.ndjson"'},
+    )
+
+@router.get("/search", response_model=SearchResponse)
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    items, engine = search_messages(db, user.id, q, limit=limit)
+    return {"items": items, "engine": engine}
@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+class SessionResponse(BaseModel):
+    id: str
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+class SessionPage(BaseModel):
+    items: List[SessionResponse]
+    next_cursor: Optional[str] = None
+
+class MessageResponse(BaseModel):
+    id: str
+    session_id: str
+    role: str
+    content: str
+    created_at: Optional[datetime] = None
+
+    model_config = {"from_attributes": True}
+
+class MessagePage(BaseModel):
+    items: List[MessageResponse]
+    next_cursor: Optional[str] = None
+
+class SearchResponse(BaseModel):
+    items: List[MessageResponse]
+    engine: str
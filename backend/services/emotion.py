@@ -10,6 +10,10 @@ class EmotionResult:
 
 
 class EmotionAnalyzer:
+    def __init__(self, verbose: bool = True):
+        # verbose=False: 批次 / replay 時關掉逐筆 print
+        self.verbose = verbose
+
     def analyze(self, text: str) -> EmotionResult:
         text = text.lower()
 
@@ -20,6 +24,10 @@ class EmotionAnalyzer:
         # very naive lexical cues (可解釋)
         if any(w in text for w in ["累", "難過", "好煩", "撐不下去"]):
             sadness += 0.6
+
+        # 危機字眼：直接拉到高強度（urgency >= 0.7 -> priority 1）
+        if any(w in text for w in ["撐不下去", "活不下去", "不想活", "想死", "自殺"]):
+            sadness = max(sadness, 0.9)
         
         if any(w in text for w in ["氣", "不爽", "受不了"]):
             anger += 0.6
@@ -45,9 +53,10 @@ class EmotionAnalyzer:
         label = max(fuzzy, key=fuzzy.get)
         intensity = fuzzy[label]
 
-        print("[EmotionAnalyzer]")
-        print(" text = ", text)
-        print(" fuzzy = ", fuzzy)
+        if self.verbose:
+            print("[EmotionAnalyzer]")
+            print(" text = ", text)
+            print(" fuzzy = ", fuzzy)
 
         return EmotionResult(
             label = label,
@@ -1,14 +1,15 @@
 import asyncio
 import os
-from typing import AsyncGenerator
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
+from typing import AsyncGenerator, Optional
 
-# ========== load env ==========
-load_dotenv()
+# openai / dotenv 延遲到真的建立 client 時才 import，
+# 讓 import backend.* 保持輕量（測試、CLI、worker spawn 都會受惠）
 
 # ========== Abstract Interface ==========
 class LLMClient:
+    # 同時能跑幾個 stream（Worker 依此決定 scheduler slots / load 的分母）
+    max_concurrency: int = 8
+
     async def stream_chat(self, prompt: str) -> AsyncGenerator[str, None]:
         """
         Abstract streaming interface.
@@ -21,13 +22,33 @@ class OpenAILLMClient(LLMClient):
     """
     OpenAI Streaming LLM Client
     """
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
+    def __init__(
+            self,
+            model: str = "gpt-4o-mini",
+            base_url: Optional[str] = None,
+            api_key_env: str = "OPENAI_API_KEY",
+    ):
+        """
+        base_url: 任何 OpenAI-compatible endpoint（例如本機 stand-in server）
+        """
+        self.model = model
+        self.base_url = base_url
+
+        from dotenv import load_dotenv
+        from openai import AsyncOpenAI
+
+        # ========== load env ==========
+        load_dotenv()
+
+        api_key = os.getenv(api_key_env)
         if not api_key:
-            raise RuntimeError("OPENAI_API_KEY not set")
+            if base_url is None:
+                raise RuntimeError(f"{api_key_env} not set")
+            # 本機 OpenAI-compatible server 通常不檢查 key
+            api_key = "not-needed"
         
         # init OpenAI async client
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url)
 
         # Debug / verification log
         print("LLM: OpenAI client initialized")
@@ -46,7 +67,7 @@ class OpenAILLMClient(LLMClient):
 
         try: 
             stream = await self.client.chat.completions.create(
-                model = "gpt-4o-mini",
+                model = self.model,
                 messages = [
                     {
                         "role": "system",
@@ -79,16 +100,33 @@ class OpenAILLMClient(LLMClient):
             self,
             messages: list[dict],
             max_words: int = 100,
+            usage: Optional[dict] = None,
+            model: Optional[str] = None,
+            priority: Optional[int] = None,
     ) -> AsyncGenerator[str, None]:
+        """
+        model: 覆寫預設 model（例如 policy 在高負載時改用較便宜的 model）
+        priority: 單一 backend 用不到（LLMRouter 用來選 backend）
+        usage: 若有傳入 dict，串流結束時會填入實際 token 用量
+        （prompt_tokens / completion_tokens / total_tokens）
+        """
         
         stream = await self.client.chat.completions.create(
-            model = "gpt-4o-mini",
+            model = model or self.model,
             messages = messages,
             stream = True,
             max_tokens = max_words * 2,
+            stream_options = {"include_usage": True},
         )
 
         async for chunk in stream:
+            # include_usage: 最後一個 chunk 沒有 choices，只有 usage
+            if chunk.usage is not None and usage is not None:
+                usage["prompt_tokens"] = chunk.usage.prompt_tokens
+                usage["completion_tokens"] = chunk.usage.completion_tokens
+                usage["total_tokens"] = chunk.usage.total_tokens
+            if not chunk.choices:
+                continue
             delta = chunk.choices[0].delta
             if delta and delta.content:
                 yield delta.content
@@ -96,10 +134,60 @@ class OpenAILLMClient(LLMClient):
 
 # ========== Mock Implementation (for testing / fallback) ==========
 class MockLLMClient(LLMClient):
+    """
+    Stand-in LLM：不需要 API key、不 import openai，
+    可用來快速開 process（scale out / 壓測 / 測試）
+    """
+    def __init__(self, delay_sec: float = 0.3):
+        self.delay_sec = delay_sec
+
     async def stream_chat(self, prompt: str):
         text = f"我理解你正在經歷的狀態。你剛剛提到：{prompt}"
         for word in text.split(" "):
-            await asyncio.sleep(0.3)
+            await asyncio.sleep(self.delay_sec)
             print("LLM(Mock): yield", word)
             yield word + " "
-        print("LLM(Mock): done")  
\ No newline at end of file
+        print("LLM(Mock): done")
+
+    async def stream_chat_messages(
+            self,
+            messages: list[dict],
+            max_words: int = 100,
+            usage: Optional[dict] = None,
+            model: Optional[str] = None,
+            priority: Optional[int] = None,
+    ) -> AsyncGenerator[str, None]:
+        last_user = next(
+            (m["content"] for m in reversed(messages) if m["role"] == "user"),
+            "",
+        )
+        text = f"我理解你正在經歷的狀態。你剛剛提到：{last_user}"
+        words = text.split(" ")[:max_words]
+        for word in words:
+            await asyncio.sleep(self.delay_sec)
+            yield word + " "
+
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(m["content"]) for m in messages)
+            usage["completion_tokens"] = len(words)
+            usage["total_tokens"] = usage["prompt_tokens"] + len(words)
+
+
+# ========== Factory ==========
+LLM_BACKENDS = ("openai", "mock", "router")
+
+def create_llm_client(backend: str = "openai") -> LLMClient:
+    """
+    backend:
+    - "openai": OpenAILLMClient（需要 OPENAI_API_KEY）
+    - "mock":   MockLLMClient（stand-in，無外部依賴）
+    - "router": LLMRouter，多個 backend 依 LLM_BACKENDS（JSON）設定
+    """
+    if backend == "openai":
+        return OpenAILLMClient()
+    if backend == "mock":
+        return MockLLMClient(delay_sec=float(os.getenv("MOCK_LLM_DELAY_SEC", "0.05")))
+    if backend == "router":
+        from backend.services.llm_router import LLMRouter
+        return LLMRouter.from_env()
+    raise ValueError(f"Unknown LLM backend: {backend!r} (expected one of {LLM_BACKENDS})")
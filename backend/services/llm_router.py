@@ -0,0 +1,262 @@
+import asyncio
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import AsyncGenerator, List, Optional
+
+from backend.services.llm import LLMClient, MockLLMClient, OpenAILLMClient
+
+
+# ========== Config ==========
+@dataclass
+class BackendConfig:
+    """
+    一個 LLM backend 的設定。
+
+    kind:
+    - "openai": OpenAI 或任何 OpenAI-compatible endpoint（base_url）
+    - "mock":   in-process MockLLMClient
+    """
+    name: str
+    kind: str = "openai"
+    model: str = "gpt-4o-mini"
+    base_url: Optional[str] = None
+    api_key_env: str = "OPENAI_API_KEY"
+    weight: float = 1.0
+    max_concurrency: int = 8
+    mock_delay_sec: float = 0.05
+
+    def __post_init__(self):
+        # weight 是加權隨機的權重：全部是 0 的話 random.choices 會直接 raise
+        if not self.weight > 0:
+            raise ValueError(f"backend {self.name!r}: weight must be > 0, got {self.weight!r}")
+        if self.max_concurrency < 1:
+            raise ValueError(f"backend {self.name!r}: max_concurrency must be >= 1, got {self.max_concurrency!r}")
+
+
+def build_client(config: BackendConfig) -> LLMClient:
+    if config.kind == "openai":
+        return OpenAILLMClient(
+            model = config.model,
+            base_url = config.base_url,
+            api_key_env = config.api_key_env,
+        )
+    if config.kind == "mock":
+        return MockLLMClient(delay_sec=config.mock_delay_sec)
+    raise ValueError(f"Unknown backend kind: {config.kind!r}")
+
+
+# ========== Runtime state ==========
+@dataclass
+class BackendStats:
+    """
+    Rolling health / latency（EWMA，最近的樣本權重較高）
+    """
+    ttft_ms: float = 0.0
+    error_rate: float = 0.0
+    in_flight: int = 0
+    requests: int = 0
+    errors: int = 0
+    last_error_at: float = 0.0
+    probing: bool = False  # half-open：cooldown 後放進去試的那一個 request 還沒結束
+    alpha: float = 0.2
+
+    def record_ttft(self, ms: float) -> None:
+        if self.ttft_ms == 0.0:
+            self.ttft_ms = ms
+        else:
+            self.ttft_ms += self.alpha * (ms - self.ttft_ms)
+
+    def record_result(self, ok: bool) -> None:
+        self.requests += 1
+        if not ok:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+
+@dataclass
+class LLMBackend:
+    config: BackendConfig
+    client: LLMClient
+    stats: BackendStats = field(default_factory=BackendStats)
+    slots: asyncio.Semaphore = field(init=False)
+
+    def __post_init__(self):
+        self.slots = asyncio.Semaphore(self.config.max_concurrency)
+
+    def has_free_slot(self) -> bool:
+        return self.stats.in_flight < self.config.max_concurrency
+
+    def utilization(self) -> float:
+        return self.stats.in_flight / self.config.max_concurrency
+
+
+# ========== Router ==========
+class LLMRouter(LLMClient):
+    """
+    Latency-aware multi-backend router.
+
+    - 急件（priority <= fast_priority）：挑 TTFT 最低的健康 backend
+    - 其他：依 weight × 剩餘容量做加權隨機（load balancing）
+    - 每個 backend 有自己的 concurrency 上限（semaphore）
+    - error rate 過高的 backend 暫時移出；cooldown 後一次只放一個 probe request，
+      error rate 降回門檻以下才完全放回來，probe 失敗就重新 cooldown
+    - 串流還沒吐出第一個 chunk 就失敗時，自動換下一個 backend
+    """
+
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        fast_priority: int = 1,
+        max_error_rate: float = 0.5,
+        cooldown_sec: float = 30.0,
+        rng: Optional[random.Random] = None,
+    ):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.fast_priority = fast_priority
+        self.max_error_rate = max_error_rate
+        self.cooldown_sec = cooldown_sec
+        self._rng = rng or random.Random()
+
+    @classmethod
+    def from_configs(cls, configs: List[BackendConfig], **kwargs) -> "LLMRouter":
+        return cls([LLMBackend(config=c, client=build_client(c)) for c in configs], **kwargs)
+
+    @classmethod
+    def from_env(cls) -> "LLMRouter":
+        """
+        LLM_BACKENDS: JSON list of BackendConfig，例如
+        [{"name": "openai", "model": "gpt-4o-mini", "max_concurrency": 16},
+         {"name": "nano", "model": "gpt-4.1-nano", "weight": 2},
+         {"name": "local", "base_url": "http://127.0.0.1:8001/v1", "model": "standin"}]
+        沒設定時只有一個 OpenAI gpt-4o-mini backend
+        """
+        raw = os.getenv("LLM_BACKENDS")
+        configs = (
+            [BackendConfig(**c) for c in json.loads(raw)]
+            if raw else [BackendConfig(name="openai")]
+        )
+        return cls.from_configs(configs)
+
+    @property
+    def max_concurrency(self) -> int:
+        """所有 backend 的 slot 加總"""
+        return sum(b.config.max_concurrency for b in self.backends)
+
+    # ----- health -----
+    def _tripped(self, b: LLMBackend) -> bool:
+        return b.stats.error_rate > self.max_error_rate
+
+    def _healthy(self, b: LLMBackend) -> bool:
+        if not self._tripped(b):
+            return True
+        # cooldown 過了就讓它再接一個 request 試試（half-open）；同時只放一個 probe
+        return (
+            not b.stats.probing
+            and time.monotonic() - b.stats.last_error_at >= self.cooldown_sec
+        )
+
+    # ----- routing -----
+    def choose(
+        self,
+        priority: Optional[int] = None,
+        model: Optional[str] = None,
+        exclude: tuple = (),
+    ) -> LLMBackend:
+        pool = [b for b in self.backends if b not in exclude] or list(self.backends)
+
+        # policy 指定 model（例如高負載降級）時，優先找有該 model 的 backend
+        if model:
+            pool = [b for b in pool if b.config.model == model] or pool
+
+        healthy = [b for b in pool if self._healthy(b)] or pool
+        free = [b for b in healthy if b.has_free_slot()]
+        if not free:
+            # 全部滿了：排到最不忙的那個 backend 的 semaphore 上
+            return min(healthy, key=lambda b: b.utilization())
+
+        if priority is not None and priority <= self.fast_priority:
+            # 沒有 TTFT 樣本的 backend 視為未知，排在已知快的後面
+            return min(free, key=lambda b: (b.stats.ttft_ms == 0.0, b.stats.ttft_ms))
+
+        weights = [b.config.weight * (1.0 - b.utilization()) for b in free]
+        return self._rng.choices(free, weights=weights, k=1)[0]
+
+    async def stream_chat_messages(
+            self,
+            messages: list[dict],
+            max_words: int = 100,
+            usage: Optional[dict] = None,
+            model: Optional[str] = None,
+            priority: Optional[int] = None,
+    ) -> AsyncGenerator[str, None]:
+        tried: tuple = ()
+        while True:
+            backend = self.choose(priority=priority, model=model, exclude=tried)
+            tried += (backend,)
+
+            # policy 指定的 model 只轉給 OpenAI 本身；stand-in / 自架 backend 用自己的 model 名稱
+            passthrough = backend.config.kind == "openai" and not backend.config.base_url
+            override = model if passthrough and model != backend.config.model else None
+
+            # 被移出的 backend 這次是 half-open probe：結束前不再放別的 request 進去
+            probe = self._tripped(backend) and not backend.stats.probing
+            if probe:
+                backend.stats.probing = True
+
+            yielded = False
+            try:
+                async with backend.slots:
+                    backend.stats.in_flight += 1
+                    started_at = time.perf_counter()
+                    try:
+                        async for chunk in backend.client.stream_chat_messages(
+                            messages = messages,
+                            max_words = max_words,
+                            usage = usage,
+                            model = override,
+                        ):
+                            if not yielded:
+                                backend.stats.record_ttft((time.perf_counter() - started_at) * 1000.0)
+                                yielded = True
+                            yield chunk
+                        backend.stats.record_result(ok=True)
+                        return
+                    except (asyncio.CancelledError, GeneratorExit):
+                        raise
+                    except Exception as e:
+                        backend.stats.record_result(ok=False)
+                        print(f"LLMRouter: backend {backend.config.name} failed", repr(e))
+                        # 已經送出部分內容就不能換 backend 重來
+                        if yielded or len(tried) >= len(self.backends):
+                            raise
+                    finally:
+                        backend.stats.in_flight -= 1
+            finally:
+                if probe:
+                    backend.stats.probing = False
+
+    # ----- monitoring -----
+    def stats(self) -> List[dict]:
+        return [
+            {
+                "name": b.config.name,
+                "model": b.config.model,
+                "base_url": b.config.base_url,
+                "weight": b.config.weight,
+                "max_concurrency": b.config.max_concurrency,
+                "in_flight": b.stats.in_flight,
+                "ttft_ms": round(b.stats.ttft_ms, 1),
+                "error_rate": round(b.stats.error_rate, 3),
+                "requests": b.stats.requests,
+                "errors": b.stats.errors,
+                "healthy": self._healthy(b),
+                "probing": b.stats.probing,
+            }
+            for b in self.backends
+        ]
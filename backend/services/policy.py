@@ -1,17 +1,106 @@
-from dataclasses import dataclass
-from typing import Dict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from backend.core.load import LoadSnapshot
 
 @dataclass
 class PolicyResult:
     style: str
     priority: int
-    max_words: str
+    max_words: int
     system_prompt: str
     prompt_context: str
     rationale: Dict[str, float]
+    model: Optional[str] = None        # None = LLM client 預設 model
+    canned_reply: Optional[str] = None # 有值就不呼叫 LLM
+    degradation: int = 0               # 0 = 未降級
+
+
+@dataclass
+class DegradationStep:
+    """
+    pressure >= min_pressure 時套用（取符合的最後一階）
+    """
+    min_pressure: float
+    max_words_scale: float = 1.0
+    model: Optional[str] = None
+    canned: bool = False
+
+
+# 壓力曲線：越塞越省
+DEFAULT_DEGRADATION: List[DegradationStep] = [
+    DegradationStep(min_pressure=0.5, max_words_scale=0.75),
+    DegradationStep(min_pressure=0.8, max_words_scale=0.5, model="gpt-4.1-nano"),
+    DegradationStep(min_pressure=1.2, max_words_scale=0.5, model="gpt-4.1-nano", canned=True),
+]
+
+CANNED_REPLIES = {
+    "neutral": "收到你的訊息了！目前使用的人比較多，我稍後再給你更完整的回覆。",
+}
+
+# 回覆被急件搶佔（preempt）時，接在已送出的內容後面收尾
+PREEMPTED_WRAP_UP = "……先說到這裡，想繼續聊的話再傳訊息給我，我會接著回覆你。"
+
+
+def urgency_score(fuzzy: Dict[str, float]) -> float:
+    return max(
+        fuzzy.get("sadness", 0.0) * 0.9,
+        fuzzy.get("anxiety", 0.0) * 1.0,
+        fuzzy.get("anger", 0.0) * 0.7,
+    )
+
+
+def priority_for(urgency: float) -> int:
+    # 1 = highest
+    if urgency >= 0.7:
+        return 1
+    elif urgency >= 0.4:
+        return 3
+    return 8
+
+
+def triage_priority(emotion, session_state=None) -> int:
+    """
+    入口 triage：emotion -> queue priority
+
+    跟 PolicyEngine.decide 用同一套 urgency -> priority，queue / rate limit /
+    LLM router / scheduler 看到的是同一個數字。
+    session_state（EmotionState）有值時，取「這一則」與「session 風險」中較急的那個，
+    避免持續惡化的使用者因為一句中性訊息就掉回 priority 8。
+    """
+    urgency = urgency_score(emotion.fuzzy)
+    if session_state is not None:
+        urgency = max(urgency, session_state.risk())
+    return priority_for(urgency)
+
 
 class PolicyEngine:
-    def decide(self, emotion) -> PolicyResult:
+    def __init__(
+        self,
+        degradation: Optional[List[DegradationStep]] = None,
+        min_degradable_priority: int = 8,
+    ):
+        """
+        min_degradable_priority: priority 數字 >= 這個值才會被降級，
+        情緒急件（priority 1 / 3）永遠拿完整資源
+        """
+        self.degradation = sorted(
+            degradation if degradation is not None else DEFAULT_DEGRADATION,
+            key = lambda step: step.min_pressure,
+        )
+        self.min_degradable_priority = min_degradable_priority
+
+    def decide(
+        self,
+        emotion,
+        load: Optional[LoadSnapshot] = None,
+        session_state = None,
+        priority: Optional[int] = None,
+    ) -> PolicyResult:
+        """
+        session_state: EmotionState（可選），session 的累積風險會拉高 urgency
+        priority: 入口 triage 已經算好的 priority（ChatJob.priority），有值就沿用
+        """
         fuzzy = emotion.fuzzy
 
         sadness = fuzzy.get("sadness", 0.0)
@@ -20,18 +109,12 @@ class PolicyEngine:
         calm = fuzzy.get("calm", 0.0)
 
         # ----- Priority (1 = highest) -----
-        urgency_score = max(
-            sadness * 0.9,
-            anxiety * 1.0,
-            anger * 0.7,
-        )
-        
-        if urgency_score >= 0.7:
-            priority = 1
-        elif urgency_score >= 0.4:
-            priority = 3
-        else:
-            priority = 8
+        urgency = urgency_score(fuzzy)
+        session_risk = session_state.risk() if session_state is not None else 0.0
+        urgency = max(urgency, session_risk)
+
+        if priority is None:
+            priority = priority_for(urgency)
 
         # ----- Style -----
         style_scores = {
@@ -51,9 +134,9 @@ class PolicyEngine:
         }
 
         # ----- max words (resource control) -----
-        if urgency_score >= 0.7:
+        if urgency >= 0.7:
             max_words = 40
-        elif urgency_score >= 0.4:
+        elif urgency >= 0.4:
             max_words = 60
         else:
             max_words = 80
@@ -67,14 +150,43 @@ class PolicyEngine:
             "請依據這些情緒強度調整回應語氣與策略。"
         )
 
-        return PolicyResult(
+        result = PolicyResult(
             style = style,
             priority = priority,
             max_words = max_words,
             system_prompt = SYSTEM_PROMPTS[style],
             prompt_context = prompt_context,
             rationale = {
-                "urgency_score": urgency_score,
+                "urgency_score": urgency,
+                "session_risk": session_risk,
                 **style_scores,
             }
-        )
\ No newline at end of file
+        )
+
+        if load is not None:
+            self._apply_load(result, load)
+
+        return result
+
+    # ----- load-aware degradation -----
+    def _apply_load(self, result: PolicyResult, load: LoadSnapshot) -> None:
+        pressure = load.pressure()
+        result.rationale["load_pressure"] = pressure
+
+        if result.priority < self.min_degradable_priority:
+            return
+
+        level = 0
+        step = None
+        for i, s in enumerate(self.degradation, start=1):
+            if pressure >= s.min_pressure:
+                level, step = i, s
+        if step is None:
+            return
+
+        result.degradation = level
+        result.max_words = max(10, int(result.max_words * step.max_words_scale))
+        if step.model:
+            result.model = step.model
+        if step.canned:
+            result.canned_reply = CANNED_REPLIES.get(result.style)
\ No newline at end of file
@@ -0,0 +1,452 @@
+"""
+Offline replay of chat request logs.
+
+把 JSONL 格式的請求紀錄（每行一筆）串流送過 EmotionAnalyzer + PolicyEngine，
+統計 priority 分佈、analyzer throughput，並模擬 queue wait。
+全程用 generator pipeline，不會把整個檔案讀進記憶體。
+
+每行格式（多餘欄位忽略）：
+    {"user_id": "u1", "message": "...", "ts": 1700000000.0}
+ts 可省略（改用 --arrival-rate 產生到達時間），也可以是 ISO 8601 字串。
+
+用法：
+    python -m backend.tools.replay logs.jsonl
+    python -m backend.tools.replay logs.jsonl --workers 8 --slots 16 --json
+    python -m backend.tools.replay logs.jsonl --full --limit 10000
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from backend.core.emotion_state import EmotionStateTracker
+from backend.services.emotion import EmotionAnalyzer, EmotionResult
+from backend.services.policy import PolicyEngine, triage_priority
+
+
+# ============ stage 1: read ============
+@dataclass
+class ReplayRecord:
+    user_id: str
+    message: str
+    ts: Optional[float] = None
+
+
+def _parse_ts(raw) -> Optional[float]:
+    if raw is None:
+        return None
+    if isinstance(raw, (int, float)):
+        return float(raw)
+    try:
+        return datetime.fromisoformat(str(raw).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+def iter_records(path: str, stats: Counter) -> Iterator[ReplayRecord]:
+    """逐行讀取；壞掉的行只計數、不中斷"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+                message = row["message"]
+            except (ValueError, KeyError, TypeError):
+                stats["bad_lines"] += 1
+                continue
+            yield ReplayRecord(
+                user_id = str(row.get("user_id", "")),
+                message = message if isinstance(message, str) else str(message),
+                ts = _parse_ts(row.get("ts")),
+            )
+
+
+def batched(it: Iterable, n: int) -> Iterator[list]:
+    it = iter(it)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+
+# ============ stage 2: analyze (CPU, process pool) ============
+# (emotion, max_words, style, user_id, ts)
+Analyzed = Tuple[EmotionResult, int, str, str, Optional[float]]
+
+_analyzer: Optional[EmotionAnalyzer] = None
+_policy: Optional[PolicyEngine] = None
+
+
+def _init_stage() -> None:
+    global _analyzer, _policy
+    _analyzer = EmotionAnalyzer(verbose=False)
+    _policy = PolicyEngine()
+
+
+def analyze_batch(batch: List[ReplayRecord]) -> List[Analyzed]:
+    if _analyzer is None:
+        _init_stage()
+    out = []
+    for rec in batch:
+        emo = _analyzer.analyze(rec.message)
+        pol = _policy.decide(emo)
+        out.append((emo, pol.max_words, pol.style, rec.user_id, rec.ts))
+    return out
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable,
+    items: Iterable,
+    max_pending: int,
+) -> Iterator:
+    """
+    有序的 executor.map，但最多只有 max_pending 個 future 在飛。
+    (Executor.map 會先把整個 iterable 吃完再 submit，檔案大時會爆記憶體)
+    """
+    pending: deque[Future] = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ============ stage 3: queue wait simulation ============
+class _Reservoir:
+    """固定大小的隨機抽樣，用來估 percentile"""
+    def __init__(self, size: int = 10_000, seed: int = 0):
+        self.size = size
+        self.samples: List[float] = []
+        self.seen = 0
+        self._rng = random.Random(seed)
+
+    def add(self, value: float) -> None:
+        self.seen += 1
+        if len(self.samples) < self.size:
+            self.samples.append(value)
+        else:
+            j = self._rng.randrange(self.seen)
+            if j < self.size:
+                self.samples[j] = value
+
+    def percentile(self, p: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+@dataclass
+class _WaitStats:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    reservoir: _Reservoir = field(default_factory=_Reservoir)
+
+    def add(self, wait: float) -> None:
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        self.reservoir.add(wait)
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_sec": self.total / self.count if self.count else 0.0,
+            "p50_sec": self.reservoir.percentile(0.50),
+            "p95_sec": self.reservoir.percentile(0.95),
+            "max_sec": self.max,
+        }
+
+
+class QueueSimulator:
+    """
+    Discrete-event simulation of TaskQueue + N LLM slots.
+
+    - 到達時間：記錄裡的 ts（相對第一筆），沒有就用固定 arrival rate
+    - 服務時間：ttft + max_words * sec_per_word
+    - 排程：priority 小的先，同 priority 依到達順序
+    記憶體只跟「同時在排隊的 job 數」有關。
+    """
+
+    def __init__(
+        self,
+        slots: int = 8,
+        ttft_sec: float = 0.8,
+        sec_per_word: float = 0.03,
+        arrival_rate: float = 20.0,
+    ):
+        self.ttft_sec = ttft_sec
+        self.sec_per_word = sec_per_word
+        self.arrival_gap = 1.0 / arrival_rate if arrival_rate > 0 else 0.0
+
+        self._slot_free_at: List[float] = [0.0] * slots
+        self._ready: List[Tuple[int, int, float, int]] = []  # (priority, seq, arrival, max_words)
+        self._seq = itertools.count()
+        self._t0: Optional[float] = None
+        self._synthetic_t = 0.0
+        self._last_t = 0.0
+        self.max_queue_depth = 0
+        self.waits: Dict[int, _WaitStats] = {}
+
+    def _arrival_time(self, ts: Optional[float]) -> float:
+        if ts is None:
+            t = self._synthetic_t
+            self._synthetic_t += self.arrival_gap
+            return t
+        if self._t0 is None:
+            self._t0 = ts
+        # log 不一定嚴格排序，時間不能倒退
+        self._last_t = max(self._last_t, ts - self._t0)
+        return self._last_t
+
+    def _dispatch_until(self, now: float) -> None:
+        # 有 slot 在 now 之前空出來，就把 ready queue 最前面的 job 丟進去
+        while self._ready and self._slot_free_at[0] <= now:
+            priority, _, arrival, max_words = heapq.heappop(self._ready)
+            free_at = heapq.heappop(self._slot_free_at)
+            start = max(free_at, arrival)
+            self.waits.setdefault(priority, _WaitStats()).add(start - arrival)
+            heapq.heappush(
+                self._slot_free_at,
+                start + self.ttft_sec + max_words * self.sec_per_word,
+            )
+
+    def arrive(self, priority: int, max_words: int, ts: Optional[float]) -> None:
+        t = self._arrival_time(ts)
+        self._dispatch_until(t)
+        heapq.heappush(self._ready, (priority, next(self._seq), t, max_words))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._ready))
+        self._dispatch_until(t)
+
+    def finish(self) -> dict:
+        self._dispatch_until(float("inf"))
+        return {
+            "max_queue_depth": self.max_queue_depth,
+            "wait_by_priority": {
+                str(p): s.summary() for p, s in sorted(self.waits.items())
+            },
+        }
+
+
+# ============ analysis replay ============
+def replay(
+    path: str,
+    workers: int = 0,
+    batch_size: int = 512,
+    limit: Optional[int] = None,
+    simulator: Optional[QueueSimulator] = None,
+) -> dict:
+    """
+    workers = 0：單一 process（小檔案 / debug）
+    workers > 0：ProcessPoolExecutor 平行跑 analyze stage
+
+    session 情緒狀態是有順序性的，所以在主 process 依序更新（O(1)/則），
+    每個 user_id 視為一個 session。
+    """
+    stats: Counter = Counter()
+    records: Iterable[ReplayRecord] = iter_records(path, stats)
+    if limit is not None:
+        records = itertools.islice(records, limit)
+    batches = batched(records, batch_size)
+
+    priorities: Counter = Counter()
+    styles: Counter = Counter()
+    escalated = 0
+    tracker = EmotionStateTracker(idle_ttl_sec=float("inf"))
+    n = 0
+
+    t0 = time.perf_counter()
+    if workers > 0:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_stage)
+        results = bounded_map(executor, analyze_batch, batches, max_pending=workers * 2)
+    else:
+        executor = None
+        results = map(analyze_batch, batches)
+
+    try:
+        for analyzed in results:
+            for emo, max_words, style, user_id, ts in analyzed:
+                n += 1
+                # 跟 /chat、/ws/chat 一樣：用「這則訊息之前」的 session 狀態 triage，再 observe
+                priority = triage_priority(emo, tracker.get(user_id, user_id))
+                if priority < triage_priority(emo):
+                    escalated += 1
+                tracker.observe(user_id, user_id, emo)
+                priorities[priority] += 1
+                styles[style] += 1
+                if simulator is not None:
+                    simulator.arrive(priority, max_words, ts)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "messages": n,
+        "bad_lines": stats["bad_lines"],
+        "elapsed_sec": elapsed,
+        "analyzer_msgs_per_sec": n / elapsed if elapsed > 0 else 0.0,
+        "priority_distribution": {str(p): c for p, c in sorted(priorities.items())},
+        "escalated_by_session_state": escalated,
+        "style_distribution": dict(styles.most_common()),
+    }
+    if simulator is not None:
+        report["queue_simulation"] = simulator.finish()
+    return report
+
+
+# ============ full path: TaskQueue + Worker + stand-in LLM ============
+async def replay_full(
+    path: str,
+    concurrency: int = 8,
+    limit: Optional[int] = None,
+    llm_delay_sec: float = 0.0,
+) -> dict:
+    """
+    真的走 TaskQueue.put -> get -> Worker.stream_reply（MockLLMClient）。
+    producer 會被 TaskQueue 的 maxsize 擋住（backpressure），所以記憶體有上限。
+    """
+    from backend.core.task_queue import ChatJob, TaskQueue
+    from backend.core.worker import Worker
+    from backend.services.llm import MockLLMClient
+
+    queue = TaskQueue(maxsize=concurrency * 4)
+    worker = Worker(queue=queue, llm=MockLLMClient(delay_sec=llm_delay_sec))
+    worker.emotion.verbose = False
+    triage = EmotionAnalyzer(verbose=False)
+
+    stats: Counter = Counter()
+    waits: Dict[int, _WaitStats] = {}
+    enqueued_at: Dict[str, Tuple[float, int]] = {}
+    done = 0
+
+    async def produce():
+        records: Iterable[ReplayRecord] = iter_records(path, stats)
+        if limit is not None:
+            records = itertools.islice(records, limit)
+        for i, rec in enumerate(records):
+            emo = triage.analyze(rec.message)
+            tracker = worker.emotion_states
+            priority = triage_priority(emo, tracker.get(rec.user_id, rec.user_id))
+            tracker.observe(rec.user_id, rec.user_id, emo)
+            job = ChatJob(job_id=str(i), user_id=rec.user_id, message=rec.message, priority=priority)
+            enqueued_at[job.job_id] = (time.perf_counter(), priority)
+            await queue.put(job, priority=priority)
+
+    async def consume():
+        nonlocal done
+        while True:
+            job = await queue.get()
+            try:
+                t_enq, priority = enqueued_at.pop(job.job_id)
+                waits.setdefault(priority, _WaitStats()).add(time.perf_counter() - t_enq)
+                async for _ in worker.stream_reply(job, session_id=job.user_id):
+                    pass
+                worker.results.pop(job.job_id, None)
+                done += 1
+            finally:
+                queue.task_done()
+
+    t0 = time.perf_counter()
+    consumers = [asyncio.create_task(consume()) for _ in range(concurrency)]
+    await produce()
+    await queue.join()
+    for c in consumers:
+        c.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "messages": done,
+        "bad_lines": stats["bad_lines"],
+        "elapsed_sec": elapsed,
+        "end_to_end_msgs_per_sec": done / elapsed if elapsed > 0 else 0.0,
+        "wait_by_priority": {str(p): s.summary() for p, s in sorted(waits.items())},
+    }
+
+
+# ============ CLI ============
+def _print_report(report: dict) -> None:
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(f"{key}:")
+            for k, v in value.items():
+                print(f"  {k}: {v}")
+        elif isinstance(value, float):
+            print(f"{key}: {value:.3f}")
+        else:
+            print(f"{key}: {value}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        prog = "python -m backend.tools.replay",
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("path", help="JSONL request log")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="analyze processes (0 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--limit", type=int, default=None)
+    parser.add_argument("--slots", type=int, default=8, help="simulated LLM slots")
+    parser.add_argument("--ttft", type=float, default=0.8, help="simulated time-to-first-token (sec)")
+    parser.add_argument("--sec-per-word", type=float, default=0.03)
+    parser.add_argument("--arrival-rate", type=float, default=20.0,
+                        help="msgs/sec for records without ts")
+    parser.add_argument("--no-sim", action="store_true", help="skip queue wait simulation")
+    parser.add_argument("--full", action="store_true",
+                        help="run through TaskQueue + Worker with the stand-in LLM")
+    parser.add_argument("--concurrency", type=int, default=8, help="--full consumers")
+    parser.add_argument("--llm-delay", type=float, default=0.0,
+                        help="--full stand-in LLM delay per word (sec)")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args(argv)
+
+    if args.full:
+        report = asyncio.run(replay_full(
+            args.path,
+            concurrency = args.concurrency,
+            limit = args.limit,
+            llm_delay_sec = args.llm_delay,
+        ))
+    else:
+        simulator = None if args.no_sim else QueueSimulator(
+            slots = args.slots,
+            ttft_sec = args.ttft,
+            sec_per_word = args.sec_per_word,
+            arrival_rate = args.arrival_rate,
+        )
+        report = replay(
+            args.path,
+            workers = args.workers,
+            batch_size = args.batch_size,
+            limit = args.limit,
+            simulator = simulator,
+        )
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        _print_report(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
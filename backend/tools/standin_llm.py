@@ -0,0 +1,83 @@
+"""
+Local OpenAI-compatible stand-in LLM server.
+
+只實作 streaming 的 POST /v1/chat/completions，回覆內容來自 MockLLMClient。
+用來在沒有 API key 的環境下測 LLMRouter / 壓測 / scale out。
+
+用法：
+    uvicorn backend.tools.standin_llm:app --port 8001
+    STANDIN_LLM_DELAY_SEC=0.02 STANDIN_LLM_TTFT_SEC=0.3 uvicorn backend.tools.standin_llm:app --port 8001
+
+然後在 LLM_BACKENDS 加上：
+    {"name": "local", "base_url": "http://127.0.0.1:8001/v1", "model": "standin"}
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from backend.services.llm import MockLLMClient
+
+DELAY_SEC = float(os.getenv("STANDIN_LLM_DELAY_SEC", "0.02"))
+TTFT_SEC = float(os.getenv("STANDIN_LLM_TTFT_SEC", "0.0"))
+
+app = FastAPI(title="Stand-in LLM (OpenAI-compatible)")
+llm = MockLLMClient(delay_sec=DELAY_SEC)
+
+
+class ChatCompletionRequest(BaseModel):
+    model: str = "standin"
+    messages: list[dict]
+    stream: bool = True
+    max_tokens: Optional[int] = None
+    stream_options: Optional[dict] = None
+
+
+def _sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(req: ChatCompletionRequest):
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    max_words = (req.max_tokens or 200) // 2
+    include_usage = bool((req.stream_options or {}).get("include_usage"))
+
+    def chunk(delta: dict, finish_reason: Optional[str] = None) -> dict:
+        return {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": req.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    async def event_stream():
+        if TTFT_SEC > 0:
+            await asyncio.sleep(TTFT_SEC)
+
+        usage: dict = {}
+        yield _sse(chunk({"role": "assistant", "content": ""}))
+        async for text in llm.stream_chat_messages(req.messages, max_words=max_words, usage=usage):
+            yield _sse(chunk({"content": text}))
+        yield _sse(chunk({}, finish_reason="stop"))
+
+        if include_usage:
+            yield _sse({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": req.model,
+                "choices": [],
+                "usage": usage,
+            })
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
@@ -0,0 +1,235 @@
+"""
+History API benchmark on a generated SQLite database.
+
+產生 N 則 messages（預設一百萬）的暫存 DB，比較：
+- keyset pagination vs OFFSET pagination（翻到很深的頁）
+- 列出 user 的 sessions
+- FTS5 vs LIKE 全文搜尋
+- 有 / 沒有 composite index（--compare-no-index）
+
+用法：
+    python benchmarks/history_bench.py
+    python benchmarks/history_bench.py --messages 200000 --json
+    python benchmarks/history_bench.py --db /tmp/history.db --reuse
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from backend.db.base import Base  # noqa: E402
+from backend.db import models  # noqa: E402,F401
+from backend.db.models import Message  # noqa: E402
+from backend.db.search import ensure_fts  # noqa: E402
+from backend.history.history import list_messages, list_sessions, search_messages  # noqa: E402
+
+VOCAB = 50_000
+
+# SQLAlchemy 在 SQLite 存 DateTime 的格式
+TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+PHRASES = [
+    "今天好累", "我好擔心明天的考試", "真的受不了我的主管", "撐不下去了",
+    "週末想去看電影", "最近睡不太好", "不知道怎麼辦", "謝謝你聽我說",
+    "工作壓力很大", "跟朋友吵架了", "今天心情還不錯", "有點怕一個人",
+]
+
+
+def generate(path: str, n_messages: int, n_users: int, msgs_per_session: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    t0 = time.perf_counter()
+    base = datetime(2025, 1, 1)
+    users = [str(uuid.uuid4()) for _ in range(n_users)]
+    conn.executemany(
+        "INSERT INTO users (id, username, password_hash, created_at) VALUES (?, ?, ?, ?)",
+        [(u, f"user{i}", "x", base.strftime(TS_FORMAT)) for i, u in enumerate(users)],
+    )
+
+    sessions = []
+    batch = []
+    written = 0
+    while written < n_messages:
+        user_id = rng.choice(users)
+        session_id = str(uuid.uuid4())
+        t = base + timedelta(seconds=rng.randrange(0, 365 * 86400))
+        sessions.append((session_id, user_id, t.strftime(TS_FORMAT)))
+        for _ in range(min(msgs_per_session, n_messages - written)):
+            t += timedelta(seconds=rng.randrange(1, 120))
+            role = "user" if written % 2 == 0 else "assistant"
+            # 常見句子 + 一個低頻詞（模擬真實對話裡可被搜尋的專有名詞）
+            content = " ".join(rng.sample(PHRASES, 2)) + f" 話題{rng.randrange(VOCAB):05d}"
+            batch.append((str(uuid.uuid4()), session_id, role, content, t.strftime(TS_FORMAT)))
+            written += 1
+        if len(batch) >= 50_000:
+            conn.executemany(
+                "INSERT INTO messages (id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                batch,
+            )
+            batch.clear()
+    if batch:
+        conn.executemany(
+            "INSERT INTO messages (id, session_id, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+    conn.executemany("INSERT INTO sessions (id, user_id, created_at) VALUES (?, ?, ?)", sessions)
+    conn.commit()
+    conn.close()
+
+    return {"generate_sec": time.perf_counter() - t0, "sessions": len(sessions)}
+
+
+def _time(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return {"median_ms": statistics.median(samples), "max_ms": max(samples)}
+
+
+def run_queries(SessionLocal, repeat: int, deep_page: int) -> dict:
+    db = SessionLocal()
+    try:
+        # 挑 message 最多的 session / 最多 session 的 user
+        session_id, n_msgs = db.execute(text(
+            "SELECT session_id, COUNT(*) AS c FROM messages GROUP BY session_id ORDER BY c DESC LIMIT 1"
+        )).one()
+        user_id = db.execute(text(
+            "SELECT user_id FROM sessions GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1"
+        )).scalar()
+
+        rare = db.execute(text(
+            "SELECT m.content FROM messages AS m JOIN sessions AS s ON s.id = m.session_id "
+            "WHERE s.user_id = :u LIMIT 1"
+        ), {"u": user_id}).scalar().split()[-1]
+
+        page = 50
+        depth = min(deep_page, max(0, (n_msgs - 1) // page))
+
+        # keyset：先走到 depth 頁取得 cursor（不計時），再量「下一頁」
+        cursor = None
+        for _ in range(depth):
+            _, cursor = list_messages(db, session_id, limit=page, cursor=cursor)
+
+        def keyset_page():
+            list_messages(db, session_id, limit=page, cursor=cursor)
+
+        def offset_page():
+            (
+                db.query(Message)
+                .filter(Message.session_id == session_id)
+                .order_by(Message.created_at.asc(), Message.id.asc())
+                .offset(depth * page)
+                .limit(page)
+                .all()
+            )
+
+        # 全表 OFFSET：沒有 session 過濾時，offset 的成本才會明顯
+        global_offset = min(500_000, db.execute(text("SELECT COUNT(*) FROM messages")).scalar() - page)
+
+        def offset_global():
+            db.query(Message).order_by(Message.created_at, Message.id).offset(global_offset).limit(page).all()
+
+        def sessions_page():
+            list_sessions(db, user_id, limit=20)
+
+        return {
+            "session_messages": n_msgs,
+            "page_depth": depth,
+            "keyset_page": _time(keyset_page, repeat),
+            "offset_page": _time(offset_page, repeat),
+            "offset_global_page": _time(offset_global, max(1, repeat // 5)),
+            "list_sessions": _time(sessions_page, repeat),
+            "search_fts_rare": _time(lambda: search_messages(db, user_id, rare, limit=20, engine="fts5"), repeat),
+            "search_like_rare": _time(lambda: search_messages(db, user_id, rare, limit=20, engine="like"), repeat),
+            "search_fts_common": _time(lambda: search_messages(db, user_id, "不知道怎麼辦", limit=20, engine="fts5"), repeat),
+            "search_like_common": _time(lambda: search_messages(db, user_id, "不知道怎麼辦", limit=20, engine="like"), repeat),
+            "plan_messages": [
+                r[-1] for r in db.execute(text(
+                    "EXPLAIN QUERY PLAN SELECT * FROM messages WHERE session_id = :s "
+                    "ORDER BY created_at, id LIMIT 50"
+                ), {"s": session_id})
+            ],
+        }
+    finally:
+        db.close()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--msgs-per-session", type=int, default=400)
+    parser.add_argument("--deep-page", type=int, default=7, help="how many pages deep to paginate")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--db", default=None, help="DB path (default: temp file)")
+    parser.add_argument("--reuse", action="store_true", help="reuse an existing --db")
+    parser.add_argument("--compare-no-index", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args(argv)
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="history_bench_"), "history.db")
+    report = {"db": path, "messages": args.messages}
+
+    if not (args.reuse and os.path.exists(path)):
+        if os.path.exists(path):
+            os.remove(path)
+        report.update(generate(path, args.messages, args.users, args.msgs_per_session, args.seed))
+
+    engine = create_engine(f"sqlite:///{path}")
+    t0 = time.perf_counter()
+    report["fts5"] = ensure_fts(engine)
+    report["fts_build_sec"] = time.perf_counter() - t0
+    SessionLocal = sessionmaker(bind=engine)
+
+    report["indexed"] = run_queries(SessionLocal, args.repeat, args.deep_page)
+
+    if args.compare_no_index:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_messages_session_created"))
+            conn.execute(text("DROP INDEX IF EXISTS ix_sessions_user_created"))
+        engine.dispose()  # 丟掉 pool 裡舊的 connection（statement cache）
+        report["no_index"] = run_queries(SessionLocal, max(1, args.repeat // 5), args.deep_page)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+
+    engine.dispose()
+
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        for key, value in report.items():
+            if isinstance(value, dict):
+                print(f"{key}:")
+                for k, v in value.items():
+                    print(f"  {k}: {v}")
+            else:
+                print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
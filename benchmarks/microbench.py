@@ -0,0 +1,470 @@
+"""
+Microbenchmarks for the core hot paths, with regression thresholds.
+
+每個 case 量 ops/sec（取多輪中的 median），跟 baseline 比較：
+低於 baseline × (1 - tolerance) 就算 regression，exit 1。
+比較的是「case / 固定 reference 工作量」的比值（每一輪背靠背量），
+整台機器變慢不會被誤判成 regression。
+全部 offline、不需要 API key / 網路。
+
+用法：
+    python benchmarks/microbench.py                      # 跑 + 跟 baseline.json 比較
+    python benchmarks/microbench.py --output result.json # 另存結果
+    python benchmarks/microbench.py --update-baseline    # 在這台機器上重建 baseline
+    python benchmarks/microbench.py -k queue --tolerance 0.25
+
+baseline 跟機器有關；換 CI 機器時先跑一次 --update-baseline。
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from backend.core.emotion_state import EmotionStateTracker  # noqa: E402
+from backend.core.load import LoadSnapshot  # noqa: E402
+from backend.core.rate_limiter import RateLimiter  # noqa: E402
+from backend.core.session_store import SessionStore  # noqa: E402
+from backend.core.task_queue import ChatJob, TaskQueue  # noqa: E402
+from backend.core.worker import ChatResult, Worker  # noqa: E402
+from backend.services.emotion import EmotionAnalyzer  # noqa: E402
+from backend.services.llm import MockLLMClient  # noqa: E402
+from backend.services.llm_router import BackendConfig, LLMRouter  # noqa: E402
+from backend.services.policy import PolicyEngine  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+MESSAGES = [
+    "今天好累，真的撐不下去了",
+    "我好擔心明天的面試，不知道怎麼辦",
+    "他這樣真的讓我很不爽",
+    "週末想去看電影，有推薦嗎？",
+    "hello, how are you today?",
+    "最近工作壓力好大，每天都睡不好，好煩",
+]
+
+# case: setup() -> run(n)；run(n) 執行 n 次操作
+Case = Tuple[str, Callable[[], Callable[[int], None]]]
+CASES: List[Case] = []
+
+
+def case(name: str):
+    def deco(setup):
+        CASES.append((name, setup))
+        return setup
+    return deco
+
+
+# ============ emotion / policy ============
+@case("emotion.analyze")
+def _emotion_analyze():
+    analyzer = EmotionAnalyzer(verbose=False)
+
+    def run(n):
+        for i in range(n):
+            analyzer.analyze(MESSAGES[i % len(MESSAGES)])
+    return run
+
+
+@case("policy.decide")
+def _policy_decide():
+    analyzer = EmotionAnalyzer(verbose=False)
+    emotions = [analyzer.analyze(m) for m in MESSAGES]
+    policy = PolicyEngine()
+
+    def run(n):
+        for i in range(n):
+            policy.decide(emotions[i % len(emotions)])
+    return run
+
+
+@case("policy.decide_under_load")
+def _policy_decide_load():
+    analyzer = EmotionAnalyzer(verbose=False)
+    emotions = [analyzer.analyze(m) for m in MESSAGES]
+    tracker = EmotionStateTracker()
+    state = None
+    for e in emotions:
+        state = tracker.observe("u", "s", e)
+    load = LoadSnapshot(150, 200, 7, 8, 1800.0, 1500.0)
+    policy = PolicyEngine()
+
+    def run(n):
+        for i in range(n):
+            policy.decide(emotions[i % len(emotions)], load=load, session_state=state)
+    return run
+
+
+@case("emotion_state.observe")
+def _emotion_state_observe():
+    analyzer = EmotionAnalyzer(verbose=False)
+    emotions = [analyzer.analyze(m) for m in MESSAGES]
+    tracker = EmotionStateTracker()
+
+    def run(n):
+        for i in range(n):
+            tracker.observe(f"u{i % 1000}", "s", emotions[i % len(emotions)])
+    return run
+
+
+# ============ task queue ============
+def _queue_case(depth: int):
+    def setup():
+        loop = asyncio.new_event_loop()
+        q = TaskQueue(maxsize=depth + 10)
+        job = ChatJob(job_id="j", user_id="u", message="m")
+
+        async def prefill():
+            for i in range(depth):
+                await q.put(job, priority=(i % 10) + 1)
+        loop.run_until_complete(prefill())
+
+        async def cycle(n):
+            # 維持固定 depth：put 一個、get 一個
+            for i in range(n):
+                await q.put(job, priority=(i % 10) + 1)
+                await q.get()
+                q.task_done()
+
+        def run(n):
+            loop.run_until_complete(cycle(n))
+        return run
+    return setup
+
+
+for _depth in (10, 1_000, 10_000):
+    CASES.append((f"task_queue.put_get@depth={_depth}", _queue_case(_depth)))
+
+
+# ============ session store ============
+@case("session_store.append@10k_sessions")
+def _session_append():
+    store = SessionStore(max_turns=20)
+    sessions = [(f"u{i % 2000}", f"s{i}") for i in range(10_000)]
+    for user_id, session_id in sessions:
+        for _ in range(40):
+            store.add_user_message(user_id, session_id, "hello")
+
+    def run(n):
+        for i in range(n):
+            user_id, session_id = sessions[i % len(sessions)]
+            store.add_user_message(user_id, session_id, "hello")
+    return run
+
+
+@case("session_store.get_history@10k_sessions")
+def _session_get():
+    store = SessionStore(max_turns=20)
+    sessions = [(f"u{i % 2000}", f"s{i}") for i in range(10_000)]
+    for user_id, session_id in sessions:
+        for _ in range(40):
+            store.add_user_message(user_id, session_id, "hello")
+
+    def run(n):
+        for i in range(n):
+            user_id, session_id = sessions[i % len(sessions)]
+            store.get_history(user_id, session_id)
+    return run
+
+
+# ============ worker housekeeping ============
+def _cleanup_case(n_results: int):
+    def setup():
+        worker = Worker(
+            queue = TaskQueue(),
+            rate_limiter = RateLimiter(),
+            llm = MockLLMClient(delay_sec=0),
+        )
+        now = time.time()
+        # 全部都還沒過期：量的是「每次 stream 結束都要跑一次」的成本
+        worker.results = {
+            str(uuid.uuid4()): ChatResult(
+                job_id = "j", reply = "r", emotion = {}, policy = {}, created_at = now,
+            )
+            for _ in range(n_results)
+        }
+        # rate limiter / emotion tracker 也放同樣數量的 user / session，
+        # prune_idle 如果退化成全掃就會在這裡現形
+        emo = EmotionAnalyzer(verbose=False).analyze(MESSAGES[0])
+        for i in range(n_results):
+            worker.rate_limiter.check_request(f"u{i}", 8)
+            worker.emotion_states.observe(f"u{i}", "s", emo)
+
+        def run(n):
+            for _ in range(n):
+                worker._cleanup_expired()
+        return run
+    return setup
+
+
+for _n in (1_000, 100_000):
+    CASES.append((f"worker.cleanup_expired@{_n}_entries", _cleanup_case(_n)))
+
+
+# ============ LLM router ============
+@case("llm_router.choose")
+def _router_choose():
+    router = LLMRouter.from_configs([
+        BackendConfig(name=f"b{i}", kind="mock", weight=1 + i % 3) for i in range(4)
+    ])
+    for i, b in enumerate(router.backends):
+        b.stats.record_ttft(400.0 - 100.0 * i)
+    fastest = min(router.backends, key=lambda b: b.stats.ttft_ms)
+    # 路由正確性：急件一定要走 TTFT 最低的 backend，不是加權隨機
+    for _ in range(50):
+        chosen = router.choose(priority=1)
+        if chosen is not fastest:
+            raise AssertionError(
+                f"priority-1 routed to {chosen.config.name}, expected {fastest.config.name}"
+            )
+
+    def run(n):
+        for i in range(n):
+            router.choose(priority=1 if i % 4 == 0 else 8)
+    return run
+
+
+# ============ rate limiter ============
+@case("rate_limiter.check_request")
+def _rate_limiter():
+    limiter = RateLimiter(requests_per_sec=1e9, request_burst=10**9)
+
+    def run(n):
+        for i in range(n):
+            limiter.check_request(f"u{i % 5000}", 8)
+    return run
+
+
+# ============ auth ============
+@case("auth.jwt_decode")
+def _jwt_decode():
+    from jose import jwt
+    from backend.auth.auth import ALGORITHM, SECRET_KEY, create_access_token
+
+    token = create_access_token({"sub": str(uuid.uuid4())})
+
+    def run(n):
+        for _ in range(n):
+            jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    return run
+
+
+# ============ runner ============
+_REF_KEYS = [f"k{i}" for i in range(64)]
+
+
+def _reference(n: int) -> None:
+    """
+    固定的 pure-Python 工作量（dict / str / function call），每一輪都跟 case 背靠背跑。
+    case / reference 的比值抵消掉整台機器變快變慢（CPU steal、降頻），
+    tolerance 才能設緊
+    """
+    d = {}
+    for i in range(n):
+        k = _REF_KEYS[i & 63]
+        d[k] = d.get(k, 0) + len(k)
+        "k1" in k
+
+
+def _calibrate(run: Callable[[int], None], seconds: float) -> int:
+    """找出跑滿 seconds 需要的 n"""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        run(n)
+        elapsed = time.perf_counter() - t0
+        if elapsed >= seconds / 5 or n >= 10_000_000:
+            break
+        n *= 2
+    return max(1, int(n * seconds / max(elapsed, 1e-9)))
+
+
+def _ops(run: Callable[[int], None], n: int) -> float:
+    t0 = time.perf_counter()
+    run(n)
+    return n / (time.perf_counter() - t0)
+
+
+def measure(setup: Callable, min_time: float, rounds: int) -> dict:
+    run = setup()
+    n = _calibrate(run, min_time)
+    ref_n = _calibrate(_reference, min_time / 4)
+
+    run(n)  # warmup
+    _reference(ref_n)
+
+    # 跟 timeit 一樣量測時關掉 GC，減少雜訊
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        samples = []
+        relative = []
+        for _ in range(rounds):
+            ref = _ops(_reference, ref_n)
+            ops = _ops(run, n)
+            samples.append(ops)
+            relative.append(ops / ref)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return _summarize({"n": n, "samples": samples, "relative": relative})
+
+
+def _summarize(r: dict) -> dict:
+    """所有 rounds（含 --confirm 補量的）一起取 median"""
+    ops = statistics.median(r["samples"])
+    return {
+        **r,
+        "ops_per_sec": ops,
+        "ns_per_op": 1e9 / ops,
+        "rel": statistics.median(r["relative"]),
+        "stdev_pct": (statistics.stdev(r["samples"]) / ops * 100.0) if len(r["samples"]) > 1 else 0.0,
+        "rounds": len(r["samples"]),
+    }
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> List[dict]:
+    rows = []
+    base_results = baseline.get("results", {})
+    per_case = baseline.get("tolerance_overrides", {})
+    for name, r in results.items():
+        base = base_results.get(name)
+        if base is None:
+            rows.append({"name": name, "status": "new"})
+            continue
+        tol = per_case.get(name, tolerance)
+        # 有 reference 比值就比比值（不受整台機器快慢影響），舊 baseline 才比絕對 ops
+        if "rel" in base:
+            ratio = r["rel"] / base["rel"]
+        else:
+            ratio = r["ops_per_sec"] / base["ops_per_sec"]
+        rows.append({
+            "name": name,
+            "ratio": ratio,
+            "tolerance": tol,
+            "status": "regression" if ratio < 1.0 - tol else "ok",
+        })
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default=None, help="only run cases containing this substring")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="allowed slowdown ratio (default: baseline file, else 0.15)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds per round")
+    parser.add_argument("--rounds", type=int, default=7)
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--confirm", type=int, default=1,
+                        help="add N more batches of rounds to a regressed case; the median is taken over all rounds")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args(argv)
+
+    results: Dict[str, dict] = {}
+    skipped: Dict[str, str] = {}
+    for name, setup in CASES:
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            results[name] = measure(setup, args.min_time, args.rounds)
+        except ImportError as e:
+            # 例如沒裝 python-jose：跳過，不算失敗
+            skipped[name] = repr(e)
+        if not args.json:
+            r = results.get(name)
+            print(f"{name:45s} {r['ops_per_sec']:>14,.0f} ops/s  ±{r['stdev_pct']:.1f}%" if r
+                  else f"{name:45s} skipped: {skipped[name]}")
+
+    meta = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get("tolerance", 0.15)
+
+    if args.update_baseline:
+        merged = {**baseline.get("results", {}), **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": meta,
+                "tolerance": tolerance,
+                "tolerance_overrides": baseline.get("tolerance_overrides", {}),
+                "results": {
+                    k: {"ops_per_sec": round(v["ops_per_sec"], 1), "rel": round(v["rel"], 6)}
+                    for k, v in sorted(merged.items())
+                },
+            }, f, indent=2)
+            f.write("\n")
+        if not args.json:
+            print(f"baseline updated: {args.baseline}")
+        return 0
+
+    comparison = compare(results, baseline, tolerance) if baseline else []
+
+    # 疑似 regression 的 case 補量幾批 rounds，跟原本的 rounds 合併後重取 median
+    # （不是取最好的一次：那會把結果往「通過」偏，真的 regression 會漏掉）
+    setups = dict(CASES)
+    for _ in range(args.confirm):
+        suspects = [row["name"] for row in comparison if row["status"] == "regression"]
+        if not suspects:
+            break
+        for name in suspects:
+            again = measure(setups[name], args.min_time, args.rounds)
+            pooled = results[name]
+            results[name] = _summarize({
+                "n": pooled["n"],
+                "samples": pooled["samples"] + again["samples"],
+                "relative": pooled["relative"] + again["relative"],
+            })
+        comparison = compare(results, baseline, tolerance)
+
+    regressions = [row for row in comparison if row["status"] == "regression"]
+
+    report = {
+        "meta": meta,
+        "tolerance": tolerance,
+        "results": results,
+        "skipped": skipped,
+        "comparison": comparison,
+        "ok": not regressions,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    elif comparison:
+        print()
+        for row in comparison:
+            if row["status"] == "new":
+                print(f"{row['name']:45s} (no baseline)")
+            else:
+                print(f"{row['name']:45s} {row['ratio']:6.2f}x baseline  {row['status'].upper()}")
+        print("OK" if not regressions else f"{len(regressions)} regression(s) beyond {tolerance:.0%}")
+    else:
+        print("no baseline; run with --update-baseline to create one")
+
+    return 0 if not regressions else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
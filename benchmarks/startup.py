@@ -0,0 +1,168 @@
+"""
+Startup benchmark.
+
+1. import time：用 `python -X importtime -c "import backend.app.main"` 量
+   backend.app.main 這棵 import 樹的 cumulative 時間，超過 budget 就 exit 1
+2. boot time：create_app(llm_backend="mock") + 跑完 lifespan startup/shutdown
+
+budget 跟機器有關：預設是 startup_baseline.json 記錄的 median × (1 + tolerance)，
+換機器時先跑一次 --update-baseline；也可以用 --budget-ms 直接指定。
+
+用法：
+    python benchmarks/startup.py
+    python benchmarks/startup.py --update-baseline --runs 9
+    python benchmarks/startup.py --budget-ms 800 --runs 5 --json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET_MODULE = "backend.app.main"
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_baseline.json")
+
+
+def parse_importtime(stderr: str, target: str = TARGET_MODULE) -> dict:
+    """
+    -X importtime 每行格式：
+    import time: self [us] | cumulative | imported package
+    縮排代表巢狀。只加總 target 跟它的 parent package（backend、backend.app）
+    這幾個最外層的 cumulative：interpreter 啟動本身的 import（encodings、site…）
+    連 `-c pass` 都有，不該算進 app 的 import time
+    """
+    parts = target.split(".")
+    roots = {".".join(parts[:i]) for i in range(1, len(parts) + 1)}
+
+    total_us = 0
+    per_module = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _self_us, cumulative_us, name_field = line[len("import time:"):].split("|")
+        name = name_field.strip()
+        cumulative = int(cumulative_us)
+        if not name_field.startswith("  ") and name in roots:  # 最外層：前面只有一個空白
+            total_us += cumulative
+        per_module[name] = cumulative
+    return {"total_us": total_us, "modules": per_module}
+
+
+def measure_import(runs: int, samples: list = None) -> dict:
+    """samples: 前幾批量到的 import ms，會跟這一批合併後取 median"""
+    samples = list(samples or [])
+    last = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {TARGET_MODULE}"],
+            cwd = ROOT,
+            capture_output = True,
+            text = True,
+            env = {**os.environ, "EMOTION_CHAT_LLM": "mock"},
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f"import {TARGET_MODULE} failed:\n{proc.stderr[-2000:]}")
+        last = parse_importtime(proc.stderr)
+        samples.append(last["total_us"] / 1000.0)
+
+    slowest = sorted(last["modules"].items(), key=lambda kv: kv[1], reverse=True)[:10]
+    return {
+        "import_ms_median": statistics.median(samples),
+        "import_ms_min": min(samples),
+        "import_samples_ms": samples,
+        "slowest_modules_ms": {name: us / 1000.0 for name, us in slowest},
+    }
+
+
+async def _boot_once() -> float:
+    from backend.app.main import create_app
+
+    t0 = time.perf_counter()
+    app = create_app(llm_backend="mock", init_database=False)
+    async with app.router.lifespan_context(app):
+        pass
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def measure_boot(runs: int) -> dict:
+    samples = [asyncio.run(_boot_once()) for _ in range(runs)]
+    return {"boot_ms_median": statistics.median(samples)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=None,
+                        help="import time budget (median); default: baseline × (1 + tolerance)")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="allowed slowdown ratio (default: baseline file, else 0.3)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--confirm", type=int, default=1,
+                        help="over budget: measure N more batches, pooled with the first one")
+    parser.add_argument("--json", action="store_true", help="machine-readable output")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    tolerance = args.tolerance if args.tolerance is not None else baseline.get("tolerance", 0.3)
+
+    result = {**measure_import(args.runs), **measure_boot(args.runs)}
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "machine": platform.machine(),
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                },
+                "tolerance": tolerance,
+                "import_ms_median": round(result["import_ms_median"], 1),
+                "boot_ms_median": round(result["boot_ms_median"], 1),
+            }, f, indent=2)
+            f.write("\n")
+        if not args.json:
+            print(f"baseline updated: {args.baseline} (import {result['import_ms_median']:.1f} ms)")
+        return 0
+
+    budget_ms = args.budget_ms
+    if budget_ms is None and "import_ms_median" in baseline:
+        budget_ms = baseline["import_ms_median"] * (1.0 + tolerance)
+    result["budget_ms"] = budget_ms
+
+    # 超過 budget 的話補量幾批、跟前面的樣本合併後重取 median（不是取最好的一次）
+    for _ in range(args.confirm):
+        if budget_ms is None or result["import_ms_median"] <= budget_ms:
+            break
+        result.update(measure_import(args.runs, result["import_samples_ms"]))
+
+    # 沒有 baseline 也沒指定 budget：只報數字，不判定
+    result["ok"] = budget_ms is None or result["import_ms_median"] <= budget_ms
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        budget = f"budget {budget_ms:.0f} ms" if budget_ms is not None else "no budget: run --update-baseline"
+        print(f"import {TARGET_MODULE}: {result['import_ms_median']:.1f} ms ({budget})")
+        print(f"boot (mock LLM):        {result['boot_ms_median']:.1f} ms")
+        print("slowest imports:")
+        for name, ms in result["slowest_modules_ms"].items():
+            print(f"  {ms:8.1f} ms  {name}")
+        print("OK" if result["ok"] else "OVER BUDGET")
+
+    return 0 if result["ok"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,5 @@
-from backend.db.engine import engine
-from backend.db.base import Base
-from ackend.db import models
+from backend.db.base import init_db
 
-Base metadata.create_all(bind=engine)
+init_db()
 
-print("Database tables created.")
\ No newline at end of file
+print("Database tables created.")